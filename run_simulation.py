@@ -1,5 +1,7 @@
 import sys
+import argparse
 from pathlib import Path
+import numpy as np
 
 # Configuración de Entorno
 BASE_DIR = Path(__file__).resolve().parent
@@ -11,40 +13,124 @@ try:
     from src.utils.config import settings, FILES
     from src.utils.data_loader import DataLoader
     from src.utils.scenarios import generate_macro_context
+    from src.utils.monte_carlo import run_monte_carlo
+    from src.utils.sharding import run_sharded
+    from src.utils.storage import read_table, write_table, table_exists
+    from src.utils.streaming import SimulationSink
+    from src.utils.profiling import SimProfiler
 except ImportError as e:
     print(f"❌ Error Crítico de Importación: {e}")
     sys.exit(1)
 
-def main():
+def parse_args():
+    parser = argparse.ArgumentParser(description="Orquestador de simulación Fashion Purse AI")
+    parser.add_argument("--monte-carlo", type=int, default=0, metavar="N",
+                        help="Número de réplicas por escenario (0 = una sola trayectoria)")
+    parser.add_argument("--trend", type=float, nargs="+", default=[1.0], help="Rejilla de trend_bias")
+    parser.add_argument("--hype", type=float, nargs="+", default=[1.0], help="Rejilla de hype_bias")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos del pool Monte Carlo / multi-tienda")
+    parser.add_argument("--seed", type=int, default=None, help="Semilla raíz (reproduce la ejecución completa)")
+    parser.add_argument("--checkpoint-every", type=int, default=None, metavar="DIAS",
+                        help="Guarda un checkpoint recuperable cada N días")
+    parser.add_argument("--resume", action="store_true", help="Reanuda el último run interrumpido")
+    parser.add_argument("--extend", type=int, default=0, metavar="DIAS",
+                        help="Prolonga el histórico existente N días (solo añade filas nuevas)")
+    parser.add_argument("--shards", action="store_true",
+                        help="Simulación multi-tienda: una tienda por ciudad + canal Online, en paralelo")
+    parser.add_argument("--reconcile-every", type=int, default=None, metavar="DIAS",
+                        help="Días entre conciliaciones de monederos y traspasos entre tiendas")
+    parser.add_argument("--profile", action="store_true",
+                        help="Mide tiempos por fase (desglose diario en daily_metrics, tabla resumen y traza flame graph)")
+    parser.add_argument("--profile-alloc", action="store_true",
+                        help="Con --profile, mide también la memoria asignada por fase (tracemalloc, más lento)")
+    return parser.parse_args()
+
+def main_monte_carlo(args):
+    print("="*60)
+    print("🎲 FASHION PURSE AI - MONTE CARLO DE ESCENARIOS")
+    print("="*60)
+
+    _, df_totals = run_monte_carlo(n_replicas=args.monte_carlo, trend_grid=args.trend, hype_grid=args.hype,
+                                   days=settings["simulation_days"], workers=args.workers, seed=args.seed)
+    print("\n✅ RESUMEN POR ESCENARIO (horizonte completo)")
+    print(df_totals.to_string(index=False, float_format="{:,.1f}".format))
+
+def main_sharded(args):
+    print("="*60)
+    print("🏬 FASHION PURSE AI - SIMULACIÓN MULTI-TIENDA")
+    print("="*60)
+
+    df_stats = run_sharded(days=settings["simulation_days"], workers=args.workers,
+                           reconcile_every=args.reconcile_every, seed=args.seed)
+    print("\n✅ THROUGHPUT POR TIENDA")
+    print(df_stats.to_string(index=False, float_format="{:,.2f}".format))
+    print(f"\n   📊 Transacciones: {df_stats['Ventas'].sum():,}")
+    print(f"   💾 Guardado en: {FILES['sales_history']}")
+
+def main_extend(days):
+    print("="*60)
+    print(f"⏩ FASHION PURSE AI - EXTENSIÓN DEL HISTÓRICO (+{days} días)")
+    print("="*60)
+
+    loader = DataLoader()
+    df_new = loader.extend(days=days)
+    print(f"\n✅ {len(df_new):,} transacciones nuevas añadidas a {FILES['sales_history']}")
+
+def main(seed=None, checkpoint_every=None, resume=False, profile=False, profile_alloc=False):
     print("="*60)
     print("👠 FASHION PURSE AI - ORQUESTADOR DE SIMULACIÓN V25")
     print("="*60)
     
     # CAMBIO AQUÍ: Usamos settings en minúscula
     days = settings["simulation_days"]
+
+    # Semilla raíz: un flujo independiente para la macro y otro para el motor de ventas
+    root = np.random.SeedSequence(seed)
+    macro_seq, sales_seq = root.spawn(2)
+    print(f"🎲 Semilla: {root.entropy}")
     
     # 1. MACROECONOMÍA
     print(f"\n🌍 1. Generando Contexto Macroeconómico ({days} días)...")
-    macro_df = generate_macro_context(days=days, trend_bias=1.0, hype_bias=1.0)
-    macro_df.to_csv(FILES["macro_indicators"], index=False)
+    if resume and table_exists("macro_indicators"):
+        # Al reanudar se reutiliza la misma trayectoria macro del run interrumpido
+        macro_df = read_table("macro_indicators")
+    else:
+        macro_df = generate_macro_context(days=days, trend_bias=1.0, hype_bias=1.0, rng=np.random.default_rng(macro_seq))
+        write_table("macro_indicators", macro_df)
     
     print(f"   -> Índice Económico Medio: {macro_df['Economic_Index'].mean():.2f}")
 
     # 2. MOTOR DE VENTAS
     print(f"\n💼 2. Iniciando Motor de Retail (Tráfico: {settings['traffic_mean']}/día)...")
     
-    loader = DataLoader()
-    df_sales = loader.generate_sales_data(days=days, macro_df=macro_df)
+    loader = DataLoader(seed=sales_seq)
+    loader.profiler = SimProfiler(enabled=profile, track_allocations=profile_alloc)
+    sink = SimulationSink()
+    # Las ventas se escriben por bloques según se generan (memoria acotada en runs largos)
+    for df_chunk, df_metrics in loader.stream_sales_data(days=days, macro_df=macro_df, sink=sink,
+                                                          checkpoint_every=checkpoint_every, resume=resume):
+        if not df_metrics.empty:
+            print(f"   -> {df_metrics['Fecha'].max():%Y-%m-%d} · {sink.sales_rows:,} transacciones volcadas")
     
     # 3. RESULTADOS
-    if not df_sales.empty:
-        df_sales.to_csv(FILES["sales_history"], index=False)
+    if sink.sales_rows:
         print("\n✅ PIPELINE FINALIZADA")
-        print(f"   📊 Transacciones: {len(df_sales):,}")
+        print(f"   📊 Transacciones: {sink.sales_rows:,}")
         print(f"   💾 Guardado en: {FILES['sales_history']}")
         print("\n👉 Siguiente paso: python -m src.models.forecasting")
     else:
         print("\n⚠️ ALERTA: No se generaron ventas.")
 
+    if profile: loader.profiler.report(trace_path=FILES["profile_trace"])
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    if args.monte_carlo > 0:
+        main_monte_carlo(args)
+    elif args.shards:
+        main_sharded(args)
+    elif args.extend > 0:
+        main_extend(args.extend)
+    else:
+        main(seed=args.seed, checkpoint_every=args.checkpoint_every, resume=args.resume,
+             profile=args.profile, profile_alloc=args.profile_alloc)
\ No newline at end of file
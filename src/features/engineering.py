@@ -1,6 +1,7 @@
 # src/features/engineering.py
 import pandas as pd
 import numpy as np
+from src.utils.config import settings
 
 def enrich_features(df: pd.DataFrame, target_col: str = 'Net_Revenue') -> pd.DataFrame:
     """Centraliza la matemática para evitar discrepancias entre Train e Inferencia."""
@@ -34,4 +35,146 @@ def get_inference_features(history: pd.Series, date: pd.Timestamp) -> pd.DataFra
     df_features = enrich_features(df_extended)
     
     # Retornamos solo la última fila (la que no tiene Target aún)
-    return df_features.iloc[[-1]].drop(columns=['Net_Revenue', 'Fecha'])
\ No newline at end of file
+    return df_features.iloc[[-1]].drop(columns=['Net_Revenue', 'Fecha'])
+
+# Ventanas que usa enrich_features (Lag_1, Lag_4, Rolling_Mean_4)
+LAGS = (1, 4)
+ROLLING_WINDOW = 4
+
+
+def week_features(dates) -> dict:
+    """Week_Sin / Week_Cos de un lote de fechas (mismo cálculo que enrich_features)."""
+    week = pd.DatetimeIndex(dates).isocalendar().week.to_numpy(dtype=float)
+    return {'Week_Sin': np.sin(2 * np.pi * week / 52), 'Week_Cos': np.cos(2 * np.pi * week / 52)}
+
+
+class LagState:
+    """
+    Estado incremental de las features de lag para varias series a la vez (una por fila).
+
+    Solo se guardan las últimas observaciones en un buffer circular, así cada paso de
+    un forecast recursivo cuesta O(series) en lugar de concatenar el histórico y
+    repetir enrich_features. La fila producida es idéntica a la de get_inference_features
+    (NaN si aún no hay histórico suficiente para un lag o para la media móvil).
+    """
+
+    def __init__(self, histories):
+        self.window = max(max(LAGS), ROLLING_WINDOW)
+        self.buffer = np.full((len(histories), self.window), np.nan)
+        self.pos = 0  # Próxima posición a escribir (= la observación más antigua)
+        for row, history in enumerate(histories):
+            tail = np.asarray(history, dtype=float)[-self.window:]
+            self.buffer[row, self.window - len(tail):] = tail
+
+    def lag(self, k):
+        return self.buffer[:, (self.pos - k) % self.window]
+
+    def features(self, dates, columns) -> np.ndarray:
+        """Matriz (series, columnas) para la siguiente fecha de cada serie."""
+        values = week_features(dates)
+        for k in LAGS:
+            values[f'Lag_{k}'] = self.lag(k)
+        recent = np.stack([self.lag(k) for k in range(1, ROLLING_WINDOW + 1)], axis=1)
+        values[f'Rolling_Mean_{ROLLING_WINDOW}'] = recent.mean(axis=1)
+        return np.column_stack([values[c] for c in columns])
+
+    def push(self, values):
+        """Añade la nueva observación de cada serie (sobrescribe la más antigua)."""
+        self.buffer[:, self.pos] = values
+        self.pos = (self.pos + 1) % self.window
+
+
+def week_start(dates) -> pd.DatetimeIndex:
+    """Lunes (00:00) de la semana de cada fecha."""
+    dates = pd.DatetimeIndex(dates).normalize()
+    return dates - pd.to_timedelta(dates.weekday, unit='D')
+
+
+def weekly_macro(df_macro: pd.DataFrame) -> pd.DataFrame:
+    """
+    Macro remuestreada una sola vez a semanas completas lunes-domingo, indexada por
+    el lunes de cada semana: Economic_Index y Luxury_Hype medios (lookup O(1) / join).
+    """
+    if df_macro is None or df_macro.empty:
+        return pd.DataFrame(columns=['Economic_Index', 'Luxury_Hype'], index=pd.DatetimeIndex([], name='Semana'))
+    weeks = week_start(df_macro['Fecha'])
+    weekly = df_macro[['Economic_Index', 'Luxury_Hype']].groupby(weeks).mean()
+    weekly.index.name = 'Semana'
+    return weekly
+
+
+# --- JERARQUÍA DE VENTAS (Total > Cluster > Marca > Marca×Canal) ---
+HIERARCHY_LEVELS = ['Total', 'Cluster', 'Marca', 'Marca_Canal']
+MIN_ACTIVE_WEEKS = 8       # Semanas con ventas para que un canal tenga serie propia
+OTHER_CHANNEL = 'Otros'    # Cajón de los canales poco activos de cada marca
+UNKNOWN_CHANNEL = 'Sin_Canal'
+
+
+def brand_cluster(brands) -> np.ndarray:
+    """Cluster de negocio de cada marca. Definición única: settings['tier_1_brands'] → High_End."""
+    return np.where(pd.Series(brands).isin(settings['tier_1_brands']).to_numpy(), 'High_End', 'Standard')
+
+
+def hierarchy_nodes(bottom: pd.DataFrame) -> pd.DataFrame:
+    """Nodos de la jerarquía (Serie, Nivel, Cluster, Marca, Canal) a partir de las series base Marca×Canal."""
+    bottom = bottom[['Cluster', 'Marca', 'Canal']].drop_duplicates().sort_values(['Cluster', 'Marca', 'Canal'])
+    brands = bottom[['Cluster', 'Marca']].drop_duplicates()
+    nodes = [{'Serie': 'Total', 'Nivel': 'Total', 'Cluster': None, 'Marca': None, 'Canal': None}]
+    nodes += [{'Serie': c, 'Nivel': 'Cluster', 'Cluster': c, 'Marca': None, 'Canal': None} for c in bottom['Cluster'].unique()]
+    nodes += [{'Serie': m, 'Nivel': 'Marca', 'Cluster': c, 'Marca': m, 'Canal': None} for c, m in brands.itertuples(index=False)]
+    nodes += [{'Serie': f"{m}|{ch}", 'Nivel': 'Marca_Canal', 'Cluster': c, 'Marca': m, 'Canal': ch}
+              for c, m, ch in bottom.itertuples(index=False)]
+    return pd.DataFrame(nodes)
+
+
+def summing_matrix(nodes: pd.DataFrame) -> np.ndarray:
+    """
+    Matriz S (nodos × series base): S[i, j] = 1 si la serie base j suma en el nodo i.
+    Las series base son las del nivel más profundo presente (con artefactos antiguos, los clusters).
+    """
+    depth = max(HIERARCHY_LEVELS.index(level) for level in nodes['Nivel'])
+    bottom = nodes[nodes['Nivel'] == HIERARCHY_LEVELS[depth]]
+    S = np.ones((len(nodes), len(bottom)), dtype=bool)
+    for col in ['Cluster', 'Marca', 'Canal']:
+        node_vals = nodes[col].to_numpy(dtype=object)[:, None]
+        S &= pd.isna(node_vals) | (node_vals == bottom[col].to_numpy(dtype=object)[None, :])
+    return S.astype(float)
+
+
+def weekly_hierarchy(df_sales: pd.DataFrame, channels=None, nodes=None):
+    """
+    Ventas semanales (W-MON) de todos los nodos de la jerarquía, semanas sin ventas a 0.
+    channels: Client_ID → canal preferido. Los canales de una marca con menos de
+    MIN_ACTIVE_WEEKS semanas activas se agrupan en '<Marca>|Otros'.
+    nodes: jerarquía ya fijada (la del modelo entrenado); las ventas se encajan en ella.
+    Devuelve (weekly, nodes): weekly es (semanas × Serie), en el orden de nodes.
+    """
+    df = df_sales[['Fecha', 'Marca', 'Net_Revenue']].copy()
+    df['Marca'] = df['Marca'].astype(str)
+    df['Cluster'] = brand_cluster(df['Marca'])
+    if channels is not None and 'Client_ID' in df_sales.columns:
+        df['Canal'] = df_sales['Client_ID'].map(channels).fillna(UNKNOWN_CHANNEL).astype(str).to_numpy()
+    else:
+        df['Canal'] = UNKNOWN_CHANNEL
+
+    if nodes is not None:
+        # Canales que el modelo no conoce van al cajón 'Otros' de su marca
+        known = nodes.loc[nodes['Nivel'] == 'Marca_Canal', 'Serie']
+        df.loc[~(df['Marca'] + '|' + df['Canal']).isin(known), 'Canal'] = OTHER_CHANNEL
+
+    bottom = df.groupby(['Cluster', 'Marca', 'Canal', pd.Grouper(key='Fecha', freq='W-MON')])['Net_Revenue'].sum().unstack([0, 1, 2])
+    bottom = bottom.reindex(pd.date_range(bottom.index.min(), bottom.index.max(), freq='W-MON')).fillna(0.0)
+
+    if nodes is None:
+        sparse = (bottom != 0).sum() < MIN_ACTIVE_WEEKS
+        keys = pd.DataFrame(bottom.columns.tolist(), columns=['Cluster', 'Marca', 'Canal'])
+        keys.loc[sparse.to_numpy(), 'Canal'] = OTHER_CHANNEL
+        bottom = bottom.T.groupby([keys[c].to_numpy() for c in keys.columns]).sum().T
+        bottom.columns.names = keys.columns.tolist()
+        nodes = hierarchy_nodes(keys)
+
+    leaves = nodes[nodes['Nivel'] == 'Marca_Canal']
+    bottom = bottom.reindex(columns=pd.MultiIndex.from_frame(leaves[['Cluster', 'Marca', 'Canal']]), fill_value=0.0)
+    weekly = pd.DataFrame(bottom.to_numpy() @ summing_matrix(nodes).T, index=bottom.index, columns=nodes['Serie'].to_numpy())
+    weekly.index.name = 'Fecha'
+    return weekly, nodes
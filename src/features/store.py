@@ -0,0 +1,151 @@
+# src/features/store.py
+import json
+import numpy as np
+import pandas as pd
+from src.features.engineering import enrich_features, weekly_hierarchy, LAGS, ROLLING_WINDOW
+from src.utils.config import FILES
+from src.utils.storage import read_table, write_table, append_table, replace_partitions, table_exists, table_fingerprint
+
+FEATURE_COLUMNS = ['Week_Sin', 'Week_Cos', 'Lag_1', 'Lag_4', 'Rolling_Mean_4']
+STORE_VERSION = 2        # 2: weekly_features particionada por mes
+# Semanas previas que necesita enrich_features para que una fila nueva salga idéntica
+CONTEXT_WEEKS = max(max(LAGS), ROLLING_WINDOW)
+SOURCES = ["sales_history", "clients_state"]
+
+
+def client_channels():
+    """Client_ID → canal preferido (estado de clientes de la simulación o, si no hay, la base)."""
+    key = "clients_state" if table_exists("clients_state") else "clients_base"
+    if not table_exists(key): return None
+    df = read_table(key, columns=['Client_ID', 'Preferred_Channel'])
+    return df.drop_duplicates('Client_ID').set_index('Client_ID')['Preferred_Channel']
+
+
+def load_weekly_hierarchy(nodes=None):
+    """Histórico semanal de todos los nodos (Total, Cluster, Marca, Marca×Canal). Misma fuente para train e inferencia."""
+    df_raw = read_table("sales_history", columns=['Fecha', 'Marca', 'Net_Revenue', 'Client_ID'])
+    return weekly_hierarchy(df_raw, client_channels(), nodes)
+
+
+def _months(dates):
+    """Partición (YYYY-MM) de cada fecha, como la columna Mes de las tablas particionadas."""
+    return pd.Series(pd.DatetimeIndex(dates).strftime('%Y-%m'), index=getattr(dates, 'index', None))
+
+
+def series_features(serie, values):
+    """Features de una serie con enrich_features (fuente única: mismo cálculo que siempre)."""
+    df = enrich_features(pd.DataFrame({'Fecha': values.index, 'Net_Revenue': values.to_numpy()}))
+    df.insert(1, 'Serie', serie)
+    return df[['Fecha', 'Serie', 'Net_Revenue'] + FEATURE_COLUMNS]
+
+
+class FeatureStore:
+    """
+    Features semanales materializadas de todas las series de la jerarquía
+    (tabla weekly_features + metadatos en JSON).
+
+        store = FeatureStore().sync()
+        train = store.training_frame(as_of=corte)   # filas con Fecha <= corte
+        hist = store.history(series)                # semanas × Serie para el forecast
+
+    sync() solo reconstruye el histórico semanal si cambian las ventas o los clientes y,
+    aun así, recalcula únicamente desde la primera semana distinta (normalmente las
+    nuevas), con las CONTEXT_WEEKS anteriores como contexto: cada fila sale idéntica
+    a la de enrich_features sobre la serie completa. Las semanas que desaparecen del
+    origen se borran, y una serie recortada o desplazada se recalcula entera.
+
+    En disco weekly_features va particionada por mes: las semanas nuevas se añaden en
+    ficheros nuevos y solo se reescriben los meses con semanas revisadas o borradas.
+    El histórico semanal de origen (weekly_hierarchy) sí se reagrega entero desde
+    sales_history cada vez que cambian las ventas.
+    """
+
+    def __init__(self):
+        self.meta_path = FILES["feature_store_meta"]
+        self.meta = json.loads(self.meta_path.read_text()) if self.meta_path.exists() else {}
+        if self.meta.get('version') != STORE_VERSION: self.meta = {}
+        self.frame = read_table("weekly_features") if self.meta and table_exists("weekly_features") else pd.DataFrame()
+        if not self.frame.empty:
+            self.frame['Fecha'] = pd.to_datetime(self.frame['Fecha'])
+            self.frame = self.frame.sort_values(['Serie', 'Fecha'], kind='stable').reset_index(drop=True)
+
+    @property
+    def nodes(self):
+        return pd.DataFrame(self.meta['nodes']) if self.meta else None
+
+    def _fingerprints(self):
+        return {key: table_fingerprint(key) for key in SOURCES}
+
+    def sync(self, verbose=False):
+        """Pone el store al día con las tablas de origen (no hace nada si no han cambiado)."""
+        fingerprints = self._fingerprints()
+        if self.meta and self.meta.get('sources') == fingerprints: return self
+        weekly, nodes = load_weekly_hierarchy()
+        self.update(weekly, nodes, fingerprints, verbose)
+        return self
+
+    def update(self, weekly, nodes, sources=None, verbose=False):
+        """Materializa las semanas nuevas (o revisadas) de weekly (semanas × Serie)."""
+        same_nodes = self.meta and self.meta['nodes'] == nodes.to_dict('records')
+        stored = self.frame.pivot(index='Fecha', columns='Serie', values='Net_Revenue') if same_nodes else None
+
+        new_rows, first_changed = [], None
+        for serie in nodes['Serie']:
+            values = weekly[serie]
+            start = 0
+            if stored is not None and serie in stored.columns:
+                old = stored[serie].dropna()
+                common = min(len(old), len(values))
+                diff = np.flatnonzero((old.index[:common] != values.index[:common]) |
+                                      (old.to_numpy()[:common] != values.to_numpy()[:common]))
+                start = diff[0] if len(diff) else common
+                # Con poco histórico el relleno inicial (bfill) aún depende de las semanas nuevas.
+                # Histórico recortado o desplazado (otra primera semana): la serie se rehace entera
+                if start <= CONTEXT_WEEKS or len(values) < len(old) or (len(old) and old.index[0] != values.index[0]):
+                    start = 0
+            if start >= len(values): continue
+            context = max(start - CONTEXT_WEEKS, 0)
+            new_rows.append(series_features(serie, values.iloc[context:]).iloc[start - context:])
+            first_changed = values.index[start] if first_changed is None else min(first_changed, values.index[start])
+
+        appended = pd.concat(new_rows, ignore_index=True) if new_rows else pd.DataFrame(columns=self.frame.columns)
+        removed, rewrite = 0, set()
+        if stored is not None:
+            # Semanas que ya no existen en el origen (histórico truncado o fechas desplazadas)
+            gone = ~self.frame['Fecha'].isin(weekly.index)
+            removed = int(gone.sum())
+            # Meses con filas revisadas (p.ej. la última semana, que estaba incompleta) o borradas: se reescriben
+            revised = appended.set_index(['Fecha', 'Serie']).index.isin(self.frame.set_index(['Fecha', 'Serie']).index)
+            rewrite = set(_months(self.frame.loc[gone, 'Fecha'])) | set(_months(appended.loc[revised, 'Fecha']))
+            keep = ~gone & ~self.frame.set_index(['Fecha', 'Serie']).index.isin(appended.set_index(['Fecha', 'Serie']).index)
+            self.frame = pd.concat([self.frame[keep], appended], ignore_index=True)
+        else:
+            self.frame = appended
+        self.frame = self.frame.sort_values(['Serie', 'Fecha'], kind='stable').reset_index(drop=True)
+
+        if stored is None:
+            FILES["weekly_features"].with_suffix(".parquet").unlink(missing_ok=True)   # Formato anterior, sin particionar
+            write_table("weekly_features", self.frame)
+        else:
+            # Tabla particionada por mes: solo se tocan los meses afectados y las semanas nuevas van a ficheros nuevos
+            replace_partitions("weekly_features", self.frame[_months(self.frame['Fecha']).isin(rewrite)], rewrite)
+            append_table("weekly_features", appended[~_months(appended['Fecha']).isin(rewrite)])
+        self.meta = {'version': STORE_VERSION, 'nodes': nodes.to_dict('records'),
+                     'sources': sources or self._fingerprints()}
+        self.meta_path.write_text(json.dumps(self.meta, ensure_ascii=False, default=str))
+        if verbose: print(f"   🧮 Feature store: {len(appended)} filas (re)calculadas, {removed} eliminadas, "
+                          f"{len(rewrite)} meses reescritos, {len(self.frame)} en total")
+        return len(appended)
+
+    # --- Consultas point-in-time ---
+    def training_frame(self, series=None, as_of=None):
+        """Filas de entrenamiento (Fecha, Serie, Net_Revenue, features) conocidas a fecha as_of."""
+        df = self.frame
+        if series is not None: df = df[df['Serie'].isin(series)]
+        if as_of is not None: df = df[df['Fecha'] <= pd.Timestamp(as_of)]
+        return df
+
+    def history(self, series=None, as_of=None):
+        """Histórico semanal (semanas × Serie) hasta as_of, en el orden de series."""
+        df = self.training_frame(series, as_of).pivot(index='Fecha', columns='Serie', values='Net_Revenue')
+        return df.reindex(columns=list(series)) if series is not None else df
@@ -0,0 +1,187 @@
+import time
+import hashlib
+import numpy as np
+import pandas as pd
+from datetime import timedelta
+from joblib import Parallel, delayed
+from src.features.engineering import hierarchy_nodes, summing_matrix, MIN_ACTIVE_WEEKS, OTHER_CHANNEL
+from src.features.store import FeatureStore, series_features
+from src.models.forecasting import fit_hierarchy, FEATURES, QUANTILE_ALPHAS, XGB_PARAMS
+from src.models.inference import forecast_hierarchy, QUANTILES
+from src.utils.config import FILES
+from src.utils.storage import read_table, write_table
+
+# --- CONFIGURACION ---
+CACHE_DIR = FILES["backtest_cache"]
+BACKTEST_VERSION = 4     # Subir si cambia el cálculo del backtest o del pipeline evaluado
+HORIZON = 12             # Semanas evaluadas tras cada fecha de corte
+STEP = 4                 # Semanas entre fechas de corte
+MIN_TRAIN = 26           # Semanas mínimas de histórico antes del primer corte
+
+
+def pinball_loss(y, q_pred, alpha):
+    """Pérdida cuantílica media (pinball) de una predicción del cuantil alpha."""
+    diff = y - q_pred
+    return np.mean(np.maximum(alpha * diff, (alpha - 1) * diff))
+
+
+def rolling_origins(index, horizon=HORIZON, step=STEP, min_train=MIN_TRAIN):
+    """
+    Fechas de corte: cada step semanas, con min_train semanas detrás y horizon semanas
+    de real delante. Ancladas al inicio del histórico para que los cortes ya evaluados
+    no se muevan al llegar datos nuevos (y sigan en caché).
+    """
+    return [index[i - 1] for i in range(min_train, len(index) - horizon + 1, step)]
+
+
+def _origin_key(weekly, df_macro, origin, horizon, multi_quantile):
+    """
+    Clave de un corte: solo depende de los datos que usa (histórico hasta el corte + real
+    del horizonte, macro hasta el corte) y de la configuración del modelo. Añadir
+    semanas nuevas no la cambia.
+    """
+    window = weekly.loc[:origin + timedelta(weeks=horizon)]
+    macro = df_macro[df_macro['Fecha'] <= origin]
+    digest = hashlib.sha256()
+    digest.update(repr((BACKTEST_VERSION, FEATURES, QUANTILE_ALPHAS, XGB_PARAMS, multi_quantile, horizon)).encode())
+    digest.update(repr(list(window.columns)).encode())
+    digest.update(np.ascontiguousarray(window.to_numpy()).tobytes())
+    digest.update(pd.util.hash_pandas_object(macro, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:24]
+
+
+def origin_hierarchy(weekly, nodes, origin):
+    """
+    Jerarquía tal como se habría construido en origin: las series Marca×Canal con menos de
+    MIN_ACTIVE_WEEKS semanas activas hasta origin van al cajón '<Marca>|Otros' y las marcas
+    sin ventas hasta origin quedan fuera (como en producción, que no las conoce todavía).
+    Devuelve (weekly recompuesto sobre esa jerarquía, semanas × Serie, nodes).
+    """
+    leaves = nodes[nodes['Nivel'] == 'Marca_Canal'].reset_index(drop=True)
+    values = weekly[leaves['Serie']]
+    past = values.loc[:origin]
+    keys = leaves[['Cluster', 'Marca', 'Canal']].copy()
+    keys.loc[((past != 0).sum() < MIN_ACTIVE_WEEKS).to_numpy(), 'Canal'] = OTHER_CHANNEL
+    known = past.T.groupby(keys['Marca'].to_numpy()).sum().T.abs().sum() > 0
+    keep = keys['Marca'].map(known).to_numpy()
+    keys, values = keys[keep], values.loc[:, keep]
+
+    bottom = values.T.groupby([keys[c].to_numpy() for c in keys.columns]).sum().T
+    nodes_o = hierarchy_nodes(pd.DataFrame(bottom.columns.tolist(), columns=['Cluster', 'Marca', 'Canal']))
+    leaves_o = nodes_o[nodes_o['Nivel'] == 'Marca_Canal']
+    bottom = bottom[pd.MultiIndex.from_frame(leaves_o[['Cluster', 'Marca', 'Canal']])]
+    weekly_o = pd.DataFrame(bottom.to_numpy() @ summing_matrix(nodes_o).T, index=weekly.index, columns=nodes_o['Serie'].to_numpy())
+    return weekly_o, nodes_o
+
+
+def evaluate_origin(features, nodes, df_macro, origin, horizon=HORIZON, multi_quantile=False):
+    """
+    Reentrena con el histórico hasta origin, predice horizon semanas de forma recursiva
+    (igual que run_forecast) y lo compara con el real. Una fila por nivel de la jerarquía.
+    features: filas del feature store. Nada posterior a origin entra en el modelo: la
+    jerarquía, las features y la macro se cortan en origin (la macro futura queda neutra,
+    como en producción); lo posterior solo se usa como real del horizonte.
+    """
+    t0 = time.perf_counter()
+    weekly, nodes = origin_hierarchy(features.pivot(index='Fecha', columns='Serie', values='Net_Revenue'), nodes, origin)
+    history = weekly.loc[:origin]
+    actual = weekly.loc[origin + timedelta(days=1):].head(horizon)
+    train = pd.concat([series_features(serie, history[serie]) for serie in nodes['Serie']], ignore_index=True)
+
+    models = fit_hierarchy(train, nodes, n_jobs=1, multi_quantile=multi_quantile)
+    df_fc = forecast_hierarchy(models, FEATURES, nodes, history, df_macro[df_macro['Fecha'] <= origin], horizon)
+    df_fc = df_fc[df_fc['Fecha'].isin(actual.index)]
+    y = actual.stack().rename('Real').rename_axis(['Fecha', 'Serie']).reset_index()
+    df_fc = df_fc.merge(y, on=['Fecha', 'Serie'])
+
+    rows = []
+    for level, df in df_fc.groupby('Nivel', sort=False):
+        real = df['Real'].to_numpy()
+        preds = df[['Base_Pesimista', 'Base_Realista', 'Base_Optimista']].to_numpy()
+        row = {'Origen': origin, 'Nivel': level, 'Series': df['Serie'].nunique(), 'Semanas': df['Fecha'].nunique()}
+        for (name, _), alpha, col in zip(QUANTILE_ALPHAS, QUANTILES, preds.T):
+            row[f'Pinball_{name.upper()}'] = pinball_loss(real, col, alpha)
+        row['Pinball_Medio'] = np.mean([row[f'Pinball_{name.upper()}'] for name, _ in QUANTILE_ALPHAS])
+        inside = (real >= preds[:, 0]) & (real <= preds[:, 2])
+        row['Cobertura_P10_P90'] = np.mean(inside)
+        # Primera semana tras el corte: la cobertura comparable con la de un paso (ver drift_check)
+        row['Cobertura_H1'] = np.mean(inside[(df['Fecha'] == actual.index[0]).to_numpy()])
+        row['MAE_P50'] = np.mean(np.abs(real - preds[:, 1]))
+        rows.append(row)
+    df_res = pd.DataFrame(rows)
+    df_res['Segundos'] = time.perf_counter() - t0
+    df_res['En_Cache'] = False
+    return df_res
+
+
+def _cached_origin(key, features, nodes, df_macro, origin, horizon, multi_quantile):
+    path = CACHE_DIR / f"{key}.pkl"
+    if path.exists():
+        # Tiempo real de esta ejecución (lectura de caché), no el del cálculo original
+        t0 = time.perf_counter()
+        df_res = pd.read_pickle(path)
+        df_res['Segundos'] = time.perf_counter() - t0
+        df_res['En_Cache'] = True
+        return df_res
+    df_res = evaluate_origin(features, nodes, df_macro, origin, horizon, multi_quantile)
+    tmp = path.with_suffix(".tmp")
+    df_res.to_pickle(tmp)
+    tmp.replace(path)
+    return df_res
+
+
+def run_backtest(horizon=HORIZON, step=STEP, min_train=MIN_TRAIN, n_jobs=-1, multi_quantile=False, use_cache=True, persist=True):
+    """
+    Backtest rolling-origin del forecast jerárquico: para cada fecha de corte reentrena,
+    predice y mide pinball por cuantil, cobertura de la banda P10-P90 y tiempo por corte.
+    Los cortes se evalúan en paralelo y se cachean por contenido: con datos nuevos
+    solo se calculan los cortes nuevos. Devuelve una fila por (corte, nivel).
+    """
+    print(f"🔁 [BACKTEST] Rolling-origin: horizonte {horizon} semanas, corte cada {step} semanas...")
+    t0 = time.perf_counter()
+    store = FeatureStore().sync()
+    nodes, weekly = store.nodes, store.history()[store.nodes['Serie']]
+    df_macro = read_table("macro_indicators", columns=['Fecha', 'Economic_Index', 'Luxury_Hype'])
+    origins = rolling_origins(weekly.index, horizon, step, min_train)
+    if not origins:
+        print(f"ERROR: Histórico insuficiente ({len(weekly)} semanas) para un corte con {min_train}+{horizon} semanas.")
+        return pd.DataFrame()
+
+    keys = [_origin_key(weekly, df_macro, o, horizon, multi_quantile) for o in origins]
+    if use_cache:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cached = sum((CACHE_DIR / f"{k}.pkl").exists() for k in keys)
+        print(f"   🗂️ {len(origins)} cortes ({cached} en caché, {len(origins) - cached} a evaluar)")
+        tasks = [delayed(_cached_origin)(k, store.frame, nodes, df_macro, o, horizon, multi_quantile) for k, o in zip(keys, origins)]
+    else:
+        tasks = [delayed(evaluate_origin)(store.frame, nodes, df_macro, o, horizon, multi_quantile) for o in origins]
+
+    df_res = pd.concat(Parallel(n_jobs=n_jobs)(tasks), ignore_index=True)
+
+    summary = df_res.groupby('Nivel', sort=False)[['Pinball_Q10', 'Pinball_Q50', 'Pinball_Q90', 'Pinball_Medio',
+                                                   'Cobertura_P10_P90', 'Cobertura_H1', 'MAE_P50']].mean()
+    print(summary.to_string(float_format="{:,.2f}".format))
+    per_origin = df_res.drop_duplicates('Origen')
+    evaluated = per_origin.loc[~per_origin['En_Cache'], 'Segundos']
+    if len(evaluated):
+        print(f"   ⏱️ {evaluated.mean():.1f}s por corte evaluado (máx {evaluated.max():.1f}s), "
+              f"{per_origin['En_Cache'].sum()} de caché, {time.perf_counter() - t0:.1f}s en total")
+    else:
+        print(f"   ⏱️ {len(per_origin)} cortes de caché, {time.perf_counter() - t0:.1f}s en total")
+
+    if persist:
+        write_table("backtest", df_res)
+        print(f"✅ Backtest guardado en: {FILES['backtest']}")
+    return df_res
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Backtest rolling-origin del forecast por cuantiles")
+    parser.add_argument("--horizon", type=int, default=HORIZON)
+    parser.add_argument("--step", type=int, default=STEP)
+    parser.add_argument("--min-train", type=int, default=MIN_TRAIN)
+    parser.add_argument("--jobs", type=int, default=-1)
+    parser.add_argument("--multi-quantile", action="store_true")
+    parser.add_argument("--no-cache", action="store_true")
+    args = parser.parse_args()
+    run_backtest(args.horizon, args.step, args.min_train, args.jobs, args.multi_quantile, not args.no_cache)
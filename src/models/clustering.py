@@ -6,6 +6,7 @@ from datetime import datetime
 import joblib
 from pathlib import Path
 import sys
+from src.utils.storage import read_table, write_table
 
 # --- CONFIGURACIÓN ---
 current_dir = Path(__file__).resolve().parent
@@ -19,7 +20,7 @@ def run_clustering_model():
     
     # 1. Carga Robusta de Datos
     try:
-        df_sales = pd.read_csv(data_path / 'sales_history.csv')
+        df_sales = read_table("sales_history")
         df_clients = pd.read_csv(raw_path / 'clients.csv')
         print(f"   ✅ Datos cargados: {len(df_sales)} transacciones, {len(df_clients)} clientes.")
     except Exception as e:
@@ -45,7 +46,7 @@ def run_clustering_model():
         df_sales['Client_ID'] = np.random.choice(
             df_clients['Client_ID'], size=len(df_sales), p=probs
         )
-        df_sales.to_csv(data_path / 'sales_history.csv', index=False)
+        write_table("sales_history", df_sales)
         print("   ✅ Vinculación completada y guardada.")
 
     # 3. Ingeniería de Características (The Feature Engine)
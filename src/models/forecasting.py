@@ -1,48 +1,298 @@
 # src/models/forecasting.py
+import time
+import numpy as np
 import pandas as pd
 import xgboost as xgb
 import joblib
+from joblib import Parallel, delayed
 from pathlib import Path
-from src.features.engineering import enrich_features # <--- IMPORTANTE
+from src.features.store import FeatureStore, FEATURE_COLUMNS # <--- IMPORTANTE
+from src.utils.storage import read_table, table_exists
 
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
-DATA_PATH = BASE_DIR / "data/processed/sales_history.csv"
 MODELS_DIR = BASE_DIR / "models"
 MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
-def train_quantile_models():
-    print("🧠 [TRAINING V24] Entrenando con Ingeniería Centralizada...")
-    
-    df_raw = pd.read_csv(DATA_PATH)
-    df_raw['Fecha'] = pd.to_datetime(df_raw['Fecha'])
-    df_raw['Cluster'] = df_raw['Marca'].apply(lambda x: 'High_End' if x in ['Hermès', 'Chanel'] else 'Standard')
-    
-    # Agrupación semanal
-    df_weekly = df_raw.groupby(['Cluster', pd.Grouper(key='Fecha', freq='W-MON')])['Net_Revenue'].sum().reset_index()
-    
-    # --- USAR INGENIERÍA CENTRALIZADA ---
-    df_enriched = df_weekly.groupby('Cluster').apply(lambda x: enrich_features(x)).reset_index(drop=True)
-    df_enriched = df_enriched.dropna()
-    
-    features = ['Week_Sin', 'Week_Cos', 'Lag_1', 'Lag_4', 'Rolling_Mean_4']
-    models_store = {}
-    
-    for cluster in ['High_End', 'Standard']:
-        data = df_enriched[df_enriched['Cluster'] == cluster]
-        X, y = data[features], data['Net_Revenue']
-        
-        cluster_models = {}
-        # Entrenar los 3 cuantiles
-        for q, alpha in [('q10', 0.1), ('q50', 0.5), ('q90', 0.9)]:
-            model = xgb.XGBRegressor(objective='reg:quantileerror', quantile_alpha=alpha,
-                                     n_estimators=500, max_depth=4, learning_rate=0.05)
-            model.fit(X, y)
-            cluster_models[alpha] = model # Guardamos por valor numérico (0.1, 0.5, 0.9)
-            
-        models_store[cluster] = cluster_models
-        
-    joblib.dump({'models': models_store, 'features': features}, MODELS_DIR / "xgboost_quantile.joblib")
-    print("✅ Modelos entrenados con éxito.")
+FEATURES = FEATURE_COLUMNS
+QUANTILE_ALPHAS = [('q10', 0.1), ('q50', 0.5), ('q90', 0.9)]
+SCALED_FEATURES = ['Lag_1', 'Lag_4', 'Rolling_Mean_4']   # Features en la escala de la serie
+XGB_PARAMS = dict(n_estimators=500, max_depth=4, learning_rate=0.05)
+ARTIFACT_PATH = MODELS_DIR / "xgboost_quantile.joblib"
+
+# --- REFRESCO INCREMENTAL ---
+WARM_TREES = 50          # Árboles que añade cada refresco incremental
+RECENT_WEEKS = 26        # Ventana reciente (antes de la marca de agua) que ve el refresco
+MAX_WARM_UPDATES = 8     # Refrescos seguidos antes de exigir un reentrenamiento completo
+MAX_NEW_WEEKS = 13       # Con más semanas nuevas se reentrena desde cero
+DRIFT_Z = 3.0            # Desplazamiento de la media semanal (en desviaciones) que cuenta como deriva
+DRIFT_SHARE = 0.25       # Fracción de series con deriva que fuerza reentrenamiento completo
+COVERAGE_DROP = 0.25     # Caída de cobertura P10-P90 (frente a la de referencia) que fuerza reentrenamiento
+NOMINAL_COVERAGE = QUANTILE_ALPHAS[-1][1] - QUANTILE_ALPHAS[0][1]   # 0.8: la banda P10-P90
+
+
+def reconcile(forecasts, S):
+    """
+    Reconciliación OLS: proyecta los forecasts de todos los nodos (nodos × semanas) sobre
+    el espacio coherente y devuelve las series base, (S'S)^-1 S' · ŷ, sin negativos.
+    Los niveles agregados se recomponen con S @ base, así que siempre suman.
+    """
+    return np.maximum(np.linalg.pinv(S) @ forecasts, 0)
+
+
+class LevelModel:
+    """
+    Modelo de cuantiles compartido por todas las series de un nivel de la jerarquía.
+    La serie entra como feature (su código) y sus lags y su objetivo van divididos por
+    su escala (venta semanal media en entrenamiento), así Marcas grandes y pequeñas
+    comparten árboles. Un paso del forecast recursivo es una llamada por nivel, no por serie.
+    models: booster multi-cuantil o {cuantil: modelo}, como los de una serie.
+    """
+
+    def __init__(self, level, series, scales, models=None):
+        self.level = level
+        self.codes = {serie: code for code, serie in enumerate(series)}
+        self.scales = np.asarray(scales, dtype=float)
+        self.scaled = [FEATURES.index(c) for c in SCALED_FEATURES]
+        self.models = models
+
+    @property
+    def series(self):
+        return list(self.codes)
+
+    def design(self, series, X):
+        """(matriz de entrada, escala por fila) para las filas X de features de series (una por fila)."""
+        codes = np.array([self.codes[s] for s in series], dtype=int)
+        X = np.array(X, dtype=float)
+        X[:, self.scaled] /= self.scales[codes, None]
+        return np.column_stack([X, codes]), self.scales[codes]
+
+    def predict(self, series, X):
+        """(filas, 3) con los cuantiles en la escala de cada serie (directo a los boosters, sin DMatrix)."""
+        X, scale = self.design(series, X)
+        if isinstance(self.models, dict):
+            q = np.column_stack([self.models[alpha].get_booster().inplace_predict(X) for _, alpha in QUANTILE_ALPHAS])
+        else:
+            q = self.models.get_booster().inplace_predict(X).reshape(len(X), len(QUANTILE_ALPHAS))
+        return q * scale[:, None]
+
+
+def _fit_quantiles(key, X, y, multi_quantile=False):
+    """
+    Los 3 cuantiles de un nivel (un hilo por modelo: el paralelismo va por niveles).
+    Por defecto un modelo por cuantil. multi_quantile: un único booster con quantile_alpha
+    vectorial (un fichero y una predicción por fila), pero XGBoost sigue ajustando árboles
+    separados por cuantil: ni entrena más rápido ni evita que los cuantiles se crucen.
+    """
+    if multi_quantile:
+        alphas = np.array([alpha for _, alpha in QUANTILE_ALPHAS])
+        model = xgb.XGBRegressor(objective='reg:quantileerror', quantile_alpha=alphas, n_jobs=1, **XGB_PARAMS)
+        return key, model.fit(X, y)
+
+    models = {}
+    for q, alpha in QUANTILE_ALPHAS:
+        model = xgb.XGBRegressor(objective='reg:quantileerror', quantile_alpha=alpha, n_jobs=1, **XGB_PARAMS)
+        model.fit(X, y)
+        models[alpha] = model # Guardamos por valor numérico (0.1, 0.5, 0.9)
+    return key, models
+
+
+def _warm_models(models, X, y):
+    """
+    Sigue impulsando los boosters de un modelo WARM_TREES rondas más, solo con datos recientes.
+    Actualiza el booster en sitio (sin copiar los árboles existentes como haría fit(xgb_model=...)).
+    """
+    dtrain = xgb.DMatrix(X, y)
+    for model in (models.values() if isinstance(models, dict) else [models]):
+        booster = model.get_booster()
+        start = booster.num_boosted_rounds()
+        for i in range(start, start + WARM_TREES):
+            booster.update(dtrain, i)
+    return models
+
+
+def _predict_quantiles(models, X):
+    """(filas, 3) con los cuantiles de un modelo multi-cuantil o de un {cuantil: modelo}."""
+    if isinstance(models, dict):
+        return np.column_stack([models[alpha].predict(X) for _, alpha in QUANTILE_ALPHAS])
+    return models.predict(X).reshape(len(X), len(QUANTILE_ALPHAS))
+
+
+def model_groups(system_models, series):
+    """Series agrupadas por modelo, [(modelo, series)]: una entrada por nivel (LevelModel) o, en artefactos antiguos, por serie."""
+    groups = {}
+    for serie in series:
+        model = system_models[serie]
+        groups.setdefault(id(model), (model, []))[1].append(serie)
+    return list(groups.values())
+
+
+def _training_matrix(model, df):
+    """(X, y, modelo a entrenar) de las filas df del feature store para un LevelModel o un modelo por serie."""
+    if isinstance(model, LevelModel):
+        X, scale = model.design(df['Serie'], df[FEATURES])
+        return X, df['Net_Revenue'].to_numpy() / scale, model.models
+    return df[FEATURES], df['Net_Revenue'], model
+
+
+def _save_artifact(artifact):
+    # Escritura atómica: el servicio de forecast vigila este fichero y no debe leerlo a medias
+    tmp = ARTIFACT_PATH.with_suffix(".tmp")
+    joblib.dump(artifact, tmp)
+    tmp.replace(ARTIFACT_PATH)
+
+
+def _reference_coverage():
+    """
+    Cobertura P10-P90 esperada a un paso por nivel: la de la primera semana tras cada corte
+    del último backtest (fuera de muestra), {Nivel: cobertura}. Vacío si no hay backtest.
+    """
+    if not table_exists("backtest"): return {}
+    df = read_table("backtest", columns=['Nivel', 'Cobertura_H1'])
+    if df.empty or 'Cobertura_H1' not in df.columns: return {}
+    return df.groupby('Nivel')['Cobertura_H1'].mean().to_dict()
+
+
+def drift_check(artifact, features, nodes):
+    """
+    ¿Basta un refresco incremental o hace falta reentrenar desde cero?
+    Compara las semanas nuevas (posteriores a la marca de agua) con la ventana reciente
+    de entrenamiento: deriva de nivel por serie y cobertura P10-P90 a un paso del modelo
+    vigente por nivel, frente a la del backtest a un paso (Cobertura_H1) de ese nivel y
+    nunca por debajo de la nominal (0.8) menos COVERAGE_DROP.
+    Devuelve (modo, motivo, nuevas) con modo 'full', 'warm' o 'none'.
+    """
+    if 'watermark' not in artifact or 'nodes' not in artifact:
+        return 'full', "artefacto sin marca de agua", 0
+    if [n['Serie'] for n in artifact['nodes']] != nodes['Serie'].tolist():
+        return 'full', "la jerarquía de series ha cambiado", 0
+    if artifact.get('warm_updates', 0) >= MAX_WARM_UPDATES:
+        return 'full', f"{MAX_WARM_UPDATES} refrescos incrementales seguidos", 0
+
+    watermark = pd.Timestamp(artifact['watermark'])
+    new = features[features['Fecha'] > watermark]
+    n_new = new['Fecha'].nunique()
+    if n_new == 0: return 'none', "sin semanas nuevas", 0
+    if n_new > MAX_NEW_WEEKS: return 'full', f"{n_new} semanas nuevas (> {MAX_NEW_WEEKS})", n_new
+
+    recent = features[(features['Fecha'] <= watermark) & (features['Fecha'] > watermark - pd.Timedelta(weeks=RECENT_WEEKS))]
+    ref = recent.groupby('Serie')['Net_Revenue'].agg(['mean', 'std'])
+    shift = (new.groupby('Serie')['Net_Revenue'].mean() - ref['mean']).abs() / (ref['std'].fillna(0) + 1e-9)
+    drifted = (shift > DRIFT_Z).mean()
+
+    inside, levels = [], []
+    new = new.dropna()
+    level_of = dict(zip(nodes['Serie'], nodes['Nivel']))
+    for model, series in model_groups(artifact['models'], nodes['Serie']):
+        df = new[new['Serie'].isin(series)]
+        if df.empty: continue
+        q = model.predict(df['Serie'], df[FEATURES]) if isinstance(model, LevelModel) else _predict_quantiles(model, df[FEATURES])
+        y = df['Net_Revenue'].to_numpy()
+        inside.append((y >= q[:, 0]) & (y <= q[:, -1]))
+        levels.append(df['Serie'].map(level_of).to_numpy())
+    coverage = pd.Series(np.concatenate(inside)).groupby(np.concatenate(levels)).mean() if inside else pd.Series(dtype=float)
+
+    if drifted > DRIFT_SHARE:
+        return 'full', f"deriva de nivel en el {drifted:.0%} de las series", n_new
+    reference = _reference_coverage()
+    threshold = pd.Series({level: max(reference.get(level, NOMINAL_COVERAGE), NOMINAL_COVERAGE) - COVERAGE_DROP
+                           for level in coverage.index}, dtype=float)
+    low = coverage[coverage < threshold]
+    if len(low):
+        worst = (low - threshold[low.index]).idxmin()
+        return 'full', (f"cobertura P10-P90 a un paso del {low[worst]:.0%} en el nivel {worst} "
+                        f"(umbral {threshold[worst]:.0%})"), n_new
+    summary = ", ".join(f"{level} {value:.0%}" for level, value in coverage.items())
+    return 'warm', f"deriva en el {drifted:.0%} de las series, cobertura a un paso {summary}", n_new
+
+
+def fit_hierarchy(features, nodes, n_jobs=-1, multi_quantile=False):
+    """
+    Un LevelModel por nivel de la jerarquía sobre las filas del feature store
+    (Fecha, Serie, Net_Revenue, features). Devuelve {serie: LevelModel de su nivel}.
+    """
+    # --- USAR INGENIERÍA CENTRALIZADA (features materializadas) ---
+    features = features.dropna()
+    by_serie = dict(tuple(features.groupby('Serie', sort=False)))
+    levels = {}
+    for level, group in nodes.groupby('Nivel', sort=False):
+        series = group['Serie'].tolist()
+        scales = [max(by_serie[s]['Net_Revenue'].abs().mean(), 1.0) if s in by_serie else 1.0 for s in series]
+        levels[level] = LevelModel(level, series, scales)
+
+    tasks = []
+    for level, model in levels.items():
+        X, y, _ = _training_matrix(model, features[features['Serie'].isin(model.series)])
+        tasks.append(delayed(_fit_quantiles)(level, X, y, multi_quantile))
+    for level, models in Parallel(n_jobs=n_jobs)(tasks):
+        levels[level].models = models
+    return {serie: levels[level] for serie, level in zip(nodes['Serie'], nodes['Nivel'])}
+
+
+def train_quantile_models(n_jobs=-1, multi_quantile=False):
+    """
+    Entrena un modelo de cuantiles por nivel de la jerarquía de ventas (Total,
+    Cluster, Marca y Marca×Canal), compartido por las series del nivel (ver LevelModel)
+    y repartiendo los niveles entre núcleos.
+    La inferencia reconcilia después los niveles para que sumen (ver reconcile).
+    Los modelos no garantizan por construcción que P10 <= P50 <= P90: el cruce solo
+    se corrige después, ordenando los cuantiles de cada serie en la inferencia.
+    """
+    print("🧠 [TRAINING V25] Entrenando forecast jerárquico con Ingeniería Centralizada...")
+    t0 = time.perf_counter()
+
+    store = FeatureStore().sync(verbose=True)
+    nodes = store.nodes
+    print(f"   🌳 {len(nodes)} series: " + ", ".join(f"{n} {level}" for level, n in nodes['Nivel'].value_counts(sort=False).items()))
+
+    models_store = fit_hierarchy(store.training_frame(), nodes, n_jobs, multi_quantile)
+
+    _save_artifact({'models': models_store, 'features': FEATURES, 'nodes': nodes.to_dict('records'),
+                    'watermark': store.frame['Fecha'].max().isoformat(), 'warm_updates': 0})
+    n_models = len(model_groups(models_store, nodes['Serie'])) * (1 if multi_quantile else len(QUANTILE_ALPHAS))
+    print(f"✅ Modelos entrenados con éxito ({n_models} modelos en {time.perf_counter() - t0:.1f}s).")
+
+
+def refresh_quantile_models(n_jobs=-1, multi_quantile=False):
+    """
+    Refresco nocturno: con semanas nuevas tras la marca de agua del artefacto sigue
+    impulsando los boosters existentes solo con datos recientes (segundos). Si el
+    drift_check lo pide (deriva, jerarquía nueva, demasiados refrescos) reentrena desde cero.
+    """
+    print("🌙 [REFRESH] Comprobando datos nuevos para el forecast...")
+    t0 = time.perf_counter()
+    if not ARTIFACT_PATH.exists(): return train_quantile_models(n_jobs, multi_quantile)
+
+    artifact = joblib.load(ARTIFACT_PATH)
+    store = FeatureStore().sync(verbose=True)
+    features = store.training_frame()
+    mode, reason, n_new = drift_check(artifact, features, store.nodes)
+    print(f"   🔎 {reason} → {'reentrenamiento completo' if mode == 'full' else 'refresco incremental' if mode == 'warm' else 'modelo al día'}")
+    if mode == 'none': return
+    if mode == 'full': return train_quantile_models(n_jobs, multi_quantile)
+
+    # Datos recientes: ventana anterior a la marca de agua + semanas nuevas
+    watermark = pd.Timestamp(artifact['watermark'])
+    recent = features[features['Fecha'] > watermark - pd.Timedelta(weeks=RECENT_WEEKS)].dropna()
+    tasks = []
+    for model, series in model_groups(artifact['models'], store.nodes['Serie']):
+        X, y, target = _training_matrix(model, recent[recent['Serie'].isin(series)])
+        tasks.append(delayed(_warm_models)(target, X, y))
+    # Hilos: xgboost suelta el GIL al entrenar y los boosters se actualizan en sitio, sin copiarlos entre procesos
+    Parallel(n_jobs=n_jobs, prefer="threads")(tasks)
+    artifact['watermark'] = features['Fecha'].max().isoformat()
+    artifact['warm_updates'] = artifact.get('warm_updates', 0) + 1
+    _save_artifact(artifact)
+    print(f"✅ Modelos actualizados con {n_new} semanas nuevas (+{WARM_TREES} árboles, "
+          f"refresco {artifact['warm_updates']}/{MAX_WARM_UPDATES}) en {time.perf_counter() - t0:.1f}s.")
 
 if __name__ == "__main__":
-    train_quantile_models()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Entrenamiento del forecast jerárquico por cuantiles")
+    parser.add_argument("--jobs", type=int, default=-1, help="Procesos de entrenamiento (-1 = todos los núcleos)")
+    parser.add_argument("--multi-quantile", action="store_true", help="Un único booster multi-cuantil por nivel")
+    parser.add_argument("--incremental", action="store_true", help="Refresco incremental desde la marca de agua (con control de deriva)")
+    args = parser.parse_args()
+    if args.incremental:
+        refresh_quantile_models(n_jobs=args.jobs, multi_quantile=args.multi_quantile)
+    else:
+        train_quantile_models(n_jobs=args.jobs, multi_quantile=args.multi_quantile)
@@ -1,120 +1,323 @@
+import io
 import pandas as pd
 import numpy as np
 import joblib
+import hashlib
 from pathlib import Path
 from datetime import timedelta
-from src.features.engineering import get_inference_features
+from src.features.engineering import LagState, week_start, weekly_macro, summing_matrix
+from src.features.store import FeatureStore, load_weekly_hierarchy
+from src.models.forecasting import LevelModel, reconcile
+from src.utils.config import FILES
+from src.utils.storage import read_table, write_table, table_exists, table_fingerprint
 
 # --- CONFIGURACION DE RUTAS ---
 BASE_DIR = Path(__file__).resolve().parent.parent.parent
-DATA_PATH = BASE_DIR / "data/processed/sales_history.csv" 
-MACRO_PATH = BASE_DIR / "data/processed/macro_indicators.csv"
 MODELS_PATH = BASE_DIR / "models/xgboost_quantile.joblib"
-OUTPUT_PATH = BASE_DIR / "data/processed/forecast_horizon.csv"
+OUTPUT_PATH = FILES["forecast"]
+QUANTILES = [0.1, 0.5, 0.9]
 
-def run_forecast(weeks_ahead=52, marketing_boost=1.0, competitor_impact=1.0):
+# --- CACHE DEL FORECAST BASE ---
+CACHE_DIR = FILES["forecast_cache"]
+CACHE_VERSION = 4        # Subir si cambia el cálculo del forecast base
+CACHE_KEEP = 8           # Entradas en disco que se conservan
+_BASE_CACHE = {}         # clave -> DataFrame base (memoria del proceso)
+_MODEL_HASHES = {}       # (ruta, tamaño, mtime) -> sha256 del artefacto
+
+def _prediction_plan(system_models, series):
     """
-    Genera predicciones futuras aplicando factores del simulador.
+    Agrupa las celdas (serie, cuantil) por modelo: en cada paso se hace una sola
+    llamada por modelo distinto, directa al booster y sobre arrays NumPy.
+    Un LevelModel da los tres cuantiles de todas las series de su nivel en la misma
+    llamada; los artefactos anteriores guardan un modelo (multi-cuantil o {cuantil: modelo})
+    por serie y los más antiguos solo los clusters.
+    """
+    plan = {}
+    for row, serie in enumerate(series):
+        models = system_models[serie]
+        if isinstance(models, LevelModel):
+            cells = [(models, serie)]
+        elif isinstance(models, dict):
+            cells = [(models[q].get_booster(), col) for col, q in enumerate(QUANTILES)]
+        else:
+            cells = [(models.get_booster(), None)]
+        for model, col in cells:
+            plan.setdefault(id(model), (model, [], []))
+            plan[id(model)][1].append(row)
+            plan[id(model)][2].append(col)
+    return [(model, np.array(rows), cols) for model, rows, cols in plan.values()]
+
+
+def _predict_step(plan, X):
+    preds = np.empty((len(X), len(QUANTILES)))
+    for model, rows, cols in plan:
+        if isinstance(model, LevelModel):
+            preds[rows] = model.predict(cols, X[rows])   # cols: serie de cada fila
+        elif cols[0] is None:
+            preds[rows] = model.inplace_predict(X[rows]).reshape(len(rows), len(QUANTILES))
+        else:
+            preds[rows, cols] = model.inplace_predict(X[rows])
+    return preds
+
+
+def _macro_grid(df_macro, dates):
+    """
+    Ajuste macro de toda la rejilla de forecast (semanas × clusters) con un único
+    join contra la tabla semanal. Semanas sin datos macro quedan en 1.0 (neutras).
+    """
+    dates = np.asarray(dates, dtype='datetime64[ns]')
+    weekly = weekly_macro(df_macro).reindex(week_start(dates.ravel()))
+    econ = weekly['Economic_Index'].fillna(1.0).to_numpy().reshape(dates.shape)
+    hype = weekly['Luxury_Hype'].fillna(1.0).to_numpy().reshape(dates.shape)
+    return econ, hype
+
+
+def _model_hash(path):
+    """sha256 del artefacto; solo se recalcula si cambia su tamaño o mtime."""
+    stat = path.stat()
+    signature = (str(path), stat.st_size, stat.st_mtime_ns)
+    if signature not in _MODEL_HASHES:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        _MODEL_HASHES[signature] = digest.hexdigest()
+    return _MODEL_HASHES[signature]
+
+
+def forecast_cache_key(weeks_ahead=52, model_hash=None):
+    """
+    Clave del forecast base: modelo + huella de los datos + horizonte.
+    model_hash: hash del artefacto con el que se calcula (ver load_artifact); por defecto, el del disco.
+    """
+    parts = [f"v{CACHE_VERSION}", model_hash or _model_hash(MODELS_PATH), table_fingerprint("sales_history"),
+             table_fingerprint("macro_indicators"), table_fingerprint("clients_state"), f"h{weeks_ahead}"]
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()[:24]
+
+
+def load_artifact(with_hash=False):
+    """
+    Deserializa el artefacto de modelos ({'models', 'features'}); None si no hay o falla.
+    with_hash: devuelve (artefacto, sha256) calculados sobre los mismos bytes leídos, para
+    que la clave de caché corresponda siempre al modelo cargado aunque el fichero cambie.
     """
-    print(f"[INFERENCE] Ejecutando forecast... Marketing: {marketing_boost}, Competencia: {competitor_impact}")
-    
-    # 1. CARGA DE ARTEFACTOS
     if not MODELS_PATH.exists():
         print("ERROR: No se encuentra el modelo entrenado.")
-        return pd.DataFrame()
-    
+        return None
     try:
-        artifact = joblib.load(MODELS_PATH)
-        system_models = artifact['models']
-        expected_features = artifact['features']
+        if not with_hash: return joblib.load(MODELS_PATH)
+        data = MODELS_PATH.read_bytes()
+        return joblib.load(io.BytesIO(data)), hashlib.sha256(data).hexdigest()
     except Exception as e:
         print(f"ERROR cargando modelo: {e}")
-        return pd.DataFrame()
+        return None
+
+
+def compute_base_forecast(weeks_ahead=52, artifact=None):
+    """
+    Forecast base (sin palancas de marketing/competencia): cuantiles por serie de la
+    jerarquía (Total, Cluster, Marca, Marca×Canal) y semana, ajustados por la macro y
+    reconciliados para que los niveles sumen. La mediana de cada serie alimenta su
+    recursión; cualquier escenario posterior es un simple reescalado (ver apply_scenario).
+    artifact: modelos ya cargados (servicio persistente); si no, se leen de disco.
+    """
+    # 1. CARGA DE ARTEFACTOS
+    artifact = artifact or load_artifact()
+    if artifact is None: return pd.DataFrame()
+    system_models = artifact['models']
+    expected_features = artifact['features']
     
     # 2. CARGA DE DATOS
-    if not DATA_PATH.exists() or not MACRO_PATH.exists():
+    if not table_exists("sales_history") or not table_exists("macro_indicators"):
         print("ERROR: Faltan datos historicos o macroeconomicos.")
         return pd.DataFrame()
 
-    df_raw = pd.read_csv(DATA_PATH)
-    df_raw['Fecha'] = pd.to_datetime(df_raw['Fecha'])
-    
-    df_macro = pd.read_csv(MACRO_PATH)
-    df_macro['Fecha'] = pd.to_datetime(df_macro['Fecha'])
-    
-    df_raw['Cluster'] = df_raw['Marca'].apply(lambda x: 'High_End' if x in ['Hermès', 'Chanel', 'Dior'] else 'Standard')
-    df_hist = df_raw.groupby(['Cluster', pd.Grouper(key='Fecha', freq='W-MON')])['Net_Revenue'].sum()
-    
-    all_results = []
-    
-    # 3. BUCLE DE PREDICCION
-    for cluster in system_models.keys():
-        try:
-            history_series = df_hist.xs(cluster).sort_index()
-        except KeyError:
-            continue
-            
-        current_history = history_series.copy()
-        last_date = history_series.index[-1]
-        
-        for i in range(1, weeks_ahead + 1):
-            next_date = last_date + timedelta(weeks=i)
-            
-            # A. Features
-            try:
-                X_row = get_inference_features(current_history.iloc[-12:], next_date)
-                X_row = X_row[expected_features]
-            except:
-                continue
-            
-            # B. Prediccion Base
-            models = system_models[cluster]
-            preds = [models[0.1].predict(X_row)[0], models[0.5].predict(X_row)[0], models[0.9].predict(X_row)[0]]
-            p_low, p_mid, p_high = np.sort(preds)
-            
-            # C. Ajuste Macro
-            start_week = next_date - timedelta(days=next_date.weekday())
-            end_week = start_week + timedelta(days=6)
-            mask = (df_macro['Fecha'] >= start_week) & (df_macro['Fecha'] <= end_week)
-            
-            econ_idx = df_macro.loc[mask, 'Economic_Index'].mean() if not df_macro[mask].empty else 1.0
-            hype_idx = df_macro.loc[mask, 'Luxury_Hype'].mean() if not df_macro[mask].empty else 1.0
-            
-            # D. APLICAR FACTORES (SIMULADOR)
-            resilience = 0.95 if (cluster == 'High_End' and econ_idx < 1.0) else 1.0
-            
-            f_macro = econ_idx * resilience * hype_idx
-            f_mkt = marketing_boost if cluster == 'Standard' else (1 + (marketing_boost - 1) * 0.6)
-            f_comp = competitor_impact
-            
-            total_multiplier = f_macro * f_mkt * f_comp
-            
-            p_mid *= total_multiplier
-            p_low *= total_multiplier
-            p_high *= total_multiplier
-            
-            p_low, p_mid, p_high = max(0, p_low), max(0, p_mid), max(0, p_high)
-            
-            # E. Riesgo (Downside Risk)
-            # Riesgo = % de ingresos que NO aseguramos
-            risk_score = (1 - (p_low / p_mid)) * 100 if p_mid > 0 else 0
-            risk_score = min(100, max(0, risk_score))
-            
-            current_history = pd.concat([current_history, pd.Series([p_mid], index=[next_date])])
-            
-            all_results.append({
-                'Fecha': next_date,
-                'Cluster': cluster,
-                'Prediccion_Realista': round(p_mid, 2),
-                'Escenario_Pesimista': round(p_low, 2),
-                'Escenario_Optimista': round(p_high, 2),
-                'Riesgo_Score': round(risk_score, 1)
-            })
-            
-    # 4. GUARDADO
-    df_res = pd.DataFrame(all_results)
-    df_res.to_csv(OUTPUT_PATH, index=False)
-    print(f"✅ Forecast guardado en: {OUTPUT_PATH}")
+    df_macro = read_table("macro_indicators", columns=['Fecha', 'Economic_Index', 'Luxury_Hype'])
+
+    # 3. JERARQUÍA Y ESTADO INICIAL POR SERIE
+    # Histórico desde el feature store (misma jerarquía que el modelo en el caso normal).
+    # Artefactos antiguos (solo clusters) no traen jerarquía: se quedan en nivel Cluster sin reconciliar
+    store = FeatureStore().sync()
+    if 'nodes' not in artifact:
+        nodes = store.nodes[store.nodes['Serie'].isin(list(system_models))].reset_index(drop=True)
+    elif [n['Serie'] for n in artifact['nodes']] == store.nodes['Serie'].tolist():
+        nodes = store.nodes
+    else:
+        nodes = None
+    if nodes is not None:
+        df_hist = store.history(nodes['Serie'])
+        if 'nodes' not in artifact:
+            # Como se entrenaron los modelos por cluster: solo semanas con ventas (sin rellenar a 0)
+            df_hist = df_hist.where(df_hist != 0)
+    else:
+        # El modelo se entrenó con otra jerarquía (p.ej. canales agrupados distinto): se encajan las ventas en ella
+        df_hist, nodes = load_weekly_hierarchy(pd.DataFrame(artifact['nodes']))
+    if nodes.empty or df_hist.empty:
+        print("ERROR: No hay histórico para ninguna serie del modelo.")
+        return pd.DataFrame()
+    return forecast_hierarchy(system_models, expected_features, nodes, df_hist, df_macro, weeks_ahead)
+
+
+def forecast_hierarchy(system_models, expected_features, nodes, df_hist, df_macro, weeks_ahead=52):
+    """
+    Forecast recursivo y reconciliado de todos los nodos a partir de un histórico semanal
+    (semanas × Serie). Es el núcleo de compute_base_forecast; el backtest lo reutiliza
+    con históricos recortados en cada fecha de corte.
+    """
+    series = nodes['Serie'].tolist()
+    # Cada serie sigue a su última semana con dato: en la jerarquía todas comparten rejilla;
+    # los artefactos antiguos por cluster traen históricos con huecos y fechas propias
+    histories = [df_hist[s].dropna() for s in series]
+    last_dates = [h.index[-1] for h in histories]
+    state = LagState([h.to_numpy() for h in histories])
+    plan = _prediction_plan(system_models, series)
+    is_high_end = (nodes['Cluster'] == 'High_End').to_numpy()
+
+    # Rejilla completa (semana, serie) conocida de antemano: la macro se une una sola vez
+    grid = [[d + timedelta(weeks=i) for d in last_dates] for i in range(1, weeks_ahead + 1)]
+    econ_grid, hype_grid = _macro_grid(df_macro, grid)
+
+    preds_all = np.empty((len(QUANTILES), len(series), weeks_ahead))
+    # 4. BUCLE DE PREDICCION (recursivo en el tiempo, vectorizado en series y cuantiles)
+    for i in range(1, weeks_ahead + 1):
+        next_dates = grid[i - 1]
+
+        # A. Features + B. Prediccion Base (cuantiles ordenados para que no se crucen)
+        X = state.features(next_dates, expected_features)
+        preds = np.sort(_predict_step(plan, X), axis=1)
+
+        # C. Ajuste Macro (forma parte del base: no depende de las palancas del simulador)
+        econ_idx, hype_idx = econ_grid[i - 1], hype_grid[i - 1]
+        resilience = np.where(is_high_end & (econ_idx < 1.0), 0.95, 1.0)
+        preds = np.maximum(preds * (econ_idx * resilience * hype_idx)[:, None], 0)
+
+        # La mediana (ya ordenada) de cada serie alimenta sus lags de la semana siguiente
+        state.push(preds[:, 1])
+        preds_all[:, :, i - 1] = preds.T
+
+    # 5. RECONCILIACIÓN: series base coherentes (cuantiles ordenados, no se cruzan) y niveles = S @ base
+    S = summing_matrix(nodes)
+    bottom = np.sort(np.stack([reconcile(p, S) for p in preds_all]), axis=0)
+    p_low, p_mid, p_high = (S @ b for b in bottom)
+
+    # Mismo orden que la salida histórica: serie y luego fecha
+    return pd.DataFrame({
+        'Fecha': pd.DatetimeIndex(np.array(grid, dtype='datetime64[ns]').T.ravel()),
+        'Nivel': np.repeat(nodes['Nivel'].to_numpy(), weeks_ahead),
+        'Serie': np.repeat(series, weeks_ahead),
+        'Cluster': np.repeat(nodes['Cluster'].fillna('Total').to_numpy(), weeks_ahead),
+        'Base_Pesimista': p_low.ravel(), 'Base_Realista': p_mid.ravel(), 'Base_Optimista': p_high.ravel()
+    })
+
+
+def _prune_cache():
+    files = sorted(CACHE_DIR.glob("*.pkl"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in files[CACHE_KEEP:]:
+        old.unlink(missing_ok=True)
+
+
+def load_base_forecast(weeks_ahead=52, use_cache=True, artifact=None, model_hash=None):
+    """
+    Forecast base desde caché (memoria → disco → cálculo). La clave incluye el hash
+    del modelo y la huella de sales_history / macro_indicators: si cambian, se recalcula solo.
+    artifact + model_hash: modelo ya cargado y su hash (load_artifact(with_hash=True));
+    sin el hash no se sabe a qué clave pertenece el resultado y no se cachea.
+    """
+    if not use_cache: return compute_base_forecast(weeks_ahead, artifact)
+    if artifact is None and not MODELS_PATH.exists(): return compute_base_forecast(weeks_ahead)
+    if artifact is not None and model_hash is None: return compute_base_forecast(weeks_ahead, artifact)
+
+    key = forecast_cache_key(weeks_ahead, model_hash)
+    if key in _BASE_CACHE: return _BASE_CACHE[key]
+
+    path = CACHE_DIR / f"{key}.pkl"
+    if path.exists():
+        df_base = pd.read_pickle(path)
+    else:
+        if artifact is None:
+            # El modelo puede haber cambiado en disco desde que se calculó la clave: se rehace con el cargado
+            loaded = load_artifact(with_hash=True)
+            if loaded is None: return pd.DataFrame()
+            artifact, model_hash = loaded
+            key = forecast_cache_key(weeks_ahead, model_hash)
+            path = CACHE_DIR / f"{key}.pkl"
+        df_base = compute_base_forecast(weeks_ahead, artifact)
+        if df_base.empty: return df_base
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        df_base.to_pickle(tmp)
+        tmp.replace(path)
+        _prune_cache()
+
+    _BASE_CACHE.clear()  # Solo la versión vigente en memoria
+    _BASE_CACHE[key] = df_base
+    return df_base
+
+
+def apply_scenario(df_base, marketing_boost=1.0, competitor_impact=1.0, level='Cluster'):
+    """
+    Escenario del simulador sobre el forecast base: reescalado vectorizado por cluster.
+    level: nivel de la jerarquía a devolver ('Cluster' conserva el formato histórico
+    de forecast_horizon); None devuelve todos los niveles.
+    """
+    if df_base.empty: return pd.DataFrame()
+
+    # D. APLICAR FACTORES (SIMULADOR)
+    # Las palancas dependen solo del cluster: todo nodo por debajo se reescala igual y
+    # sigue sumando; el Total se recompone con los clusters ya reescalados.
+    is_standard = (df_base['Cluster'] == 'Standard').to_numpy()
+    f_mkt = np.where(is_standard, marketing_boost, 1 + (marketing_boost - 1) * 0.6)
+    f_comp = competitor_impact
+    total_multiplier = f_mkt * f_comp
+
+    bases = ['Base_Pesimista', 'Base_Realista', 'Base_Optimista']
+    scaled = np.maximum(df_base[bases].to_numpy() * total_multiplier[:, None], 0)
+    if 'Nivel' in df_base.columns:
+        nivel = df_base['Nivel'].to_numpy()
+        is_total, is_cluster = nivel == 'Total', nivel == 'Cluster'
+        if is_total.any() and is_cluster.any():
+            by_week = pd.DataFrame(scaled[is_cluster]).groupby(df_base['Fecha'].to_numpy()[is_cluster]).sum()
+            scaled[is_total] = by_week.reindex(df_base['Fecha'].to_numpy()[is_total]).to_numpy()
+        keep = nivel == level if level else np.ones(len(df_base), dtype=bool)
+    else:
+        keep = np.ones(len(df_base), dtype=bool)
+    p_low, p_mid, p_high = scaled[keep].T
+
+    # E. Riesgo (Downside Risk)
+    # Riesgo = % de ingresos que NO aseguramos
+    risk_score = np.divide(p_mid - p_low, p_mid, out=np.zeros_like(p_mid), where=p_mid > 0) * 100
+    risk_score = np.clip(risk_score, 0, 100)
+
+    df_res = pd.DataFrame({
+        'Fecha': df_base['Fecha'].to_numpy()[keep],
+        'Cluster': df_base['Cluster'].to_numpy()[keep],
+        'Prediccion_Realista': p_mid.round(2),
+        'Escenario_Pesimista': p_low.round(2),
+        'Escenario_Optimista': p_high.round(2),
+        'Riesgo_Score': risk_score.round(1)
+    })
+    if 'Nivel' in df_base.columns and level != 'Cluster':
+        df_res.insert(1, 'Nivel', df_base['Nivel'].to_numpy()[keep])
+        df_res.insert(2, 'Serie', df_base['Serie'].to_numpy()[keep])
+    return df_res
+
+
+def run_forecast(weeks_ahead=52, marketing_boost=1.0, competitor_impact=1.0, use_cache=True, persist=True, level='Cluster'):
+    """
+    Genera predicciones futuras aplicando factores del simulador.
+    El forecast base se cachea (ver load_base_forecast): cambiar marketing o
+    competencia solo reescala, sin recargar modelo ni datos.
+    persist=False evita reescribir forecast_horizon (consultas interactivas).
+    level: 'Cluster' (tabla histórica), 'Total', 'Marca', 'Marca_Canal' o None (todos).
+    """
+    print(f"[INFERENCE] Ejecutando forecast... Marketing: {marketing_boost}, Competencia: {competitor_impact}")
+    df_res = apply_scenario(load_base_forecast(weeks_ahead, use_cache), marketing_boost, competitor_impact, level)
+    if df_res.empty: return df_res
+
+    # GUARDADO
+    if persist and level == 'Cluster':
+        write_table("forecast", df_res)
+        print(f"✅ Forecast guardado en: {OUTPUT_PATH}")
     return df_res
 
 if __name__ == "__main__":
@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from datetime import date, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.models.recommender import (CATALOG_COLUMNS, TOP_K, encode_catalog, encode_clients, encode_context,
+                                    load_client_profiles, recommendation_frame, score_matrix, top_k)
+from src.utils.config import FILES
+from src.utils.storage import append_csv, table_fingerprint
+
+WATCH_INTERVAL = 5.0     # Segundos entre comprobaciones de ventas, catálogo, clusters y feedback
+CACHE_SIZE = 1024        # Clientes recientes cuyas recomendaciones se conservan (LRU)
+LATENCY_WINDOW = 2000    # Peticiones recientes para los percentiles de latencia
+LATENCY_BUCKETS_MS = (0.5, 1, 2, 5, 10, 25, 50, 100)  # Límites superiores del histograma
+
+
+def _mtime(path):
+    path = Path(path)
+    return path.stat().st_mtime_ns if path.exists() else None
+
+
+class RecommendationService:
+    """
+    Recomendador online: mantiene en memoria el catálogo codificado (tablas de reglas e
+    índice de candidatos por marca) y el perfil de todos los clientes, y puntúa un
+    cliente bajo demanda con los mismos scores que generate_recommendations.
+
+        service = get_recommendation_service()
+        df = service.recommend("CL-100667")      # mismas columnas que recommendations_matrix.csv
+        service.reject("CL-100667", "Zippy Coin Purse (Black)")
+
+    Los descartes del feedback_log se quitan de los candidatos antes del Top-K, así que
+    su hueco lo ocupa el siguiente mejor producto. Caché LRU por cliente; recarga si
+    cambian las ventas, el catálogo, los clusters o el día. stats() da contadores,
+    percentiles y un histograma de latencias.
+    """
+
+    def __init__(self, watch_interval=WATCH_INTERVAL, cache_size=CACHE_SIZE, latency_window=LATENCY_WINDOW):
+        self.watch_interval = watch_interval
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._state = None
+        self._signature = None
+        self._rejected = defaultdict(set)   # Client_ID -> nombres de producto descartados
+        self._feedback_mtime = None
+        self._checked_at = 0.0
+        self._cache = OrderedDict()         # (Client_ID, k) -> recomendaciones (LRU)
+        self.latencies = deque(maxlen=latency_window)
+        self.histogram = np.zeros(len(LATENCY_BUCKETS_MS) + 1, dtype=np.int64)
+        self.counters = defaultdict(int)
+        self.loaded_at = None
+
+    # --- Estado ---
+    def _load(self):
+        """Catálogo y clientes codificados (los mismos arrays que usa el batch)."""
+        loaded = load_client_profiles()
+        if loaded is None: return None
+        df_catalog, client_profiles, today = loaded
+        items = encode_catalog(df_catalog)
+        return {
+            'items': items,
+            'clients': encode_clients(client_profiles, items, today),
+            'catalog': {c: df_catalog[c].to_numpy() for c in CATALOG_COLUMNS},
+            'context': encode_context(client_profiles),
+            'rows': dict(zip(client_profiles['Client_ID'], range(len(client_profiles)))),
+            'positions': df_catalog.groupby('Name').indices,   # Nombre -> posiciones en el catálogo
+        }
+
+    def _load_feedback(self):
+        rejected = defaultdict(set)
+        path = FILES["feedback_log"]
+        if path.exists():
+            df = pd.read_csv(path)
+            df = df[df['Action'] == 'Rejected']
+            for client_id, name in zip(df['Client_ID'], df['Product_Name']):
+                rejected[client_id].add(name)
+        return rejected
+
+    def _ensure_state(self):
+        """Estado vigente; como mucho una comprobación de disco cada watch_interval."""
+        now = time.monotonic()
+        if self._state is not None and now - self._checked_at < self.watch_interval:
+            return self._state
+        with self._lock:
+            self._checked_at = now
+            signature = (table_fingerprint("sales_history"), _mtime(FILES["accessories"]),
+                         _mtime(FILES["clients_clusters"]), date.today())
+            if signature != self._signature:
+                state = self._load()
+                if state is not None:
+                    if self._signature is not None:
+                        print("🔄 [RECO SERVICE] Ventas, catálogo o clusters actualizados: estado recargado")
+                    self._state, self._signature = state, signature
+                    self._cache.clear()
+                    self.loaded_at = time.time()
+                    self.counters['reloads'] += 1
+            feedback_mtime = _mtime(FILES["feedback_log"])
+            if feedback_mtime != self._feedback_mtime:
+                self._rejected, self._feedback_mtime = self._load_feedback(), feedback_mtime
+                self._cache.clear()
+        return self._state
+
+    # --- Scoring ---
+    def _score(self, state, client_id, k):
+        """Top-k de un cliente sobre sus candidatos, sin los productos que ha descartado."""
+        items, clients = state['items'], state['clients']
+        row = state['rows'].get(client_id)
+        cand = items['candidates'][clients['brand_code'][row]] if row is not None else np.array([], dtype=int)
+        rejected = [state['positions'][name] for name in self._rejected.get(client_id, ()) if name in state['positions']]
+        if rejected:
+            cand = np.setdiff1d(cand, np.concatenate(rejected), assume_unique=True)
+
+        cols, scores = np.array([], dtype=int), np.array([], dtype=np.int32)
+        if len(cand):
+            idx, top = top_k(score_matrix(clients, items, [row], cand), k)
+            keep = top[0] > 0   # Filtrado Final: solo scores positivos
+            cols, scores = cand[idx[0][keep]], top[0][keep]
+        rows = np.full(len(cols), row if row is not None else 0)
+        return recommendation_frame(clients, items, state['catalog'], state['context'], rows, cols, scores)
+
+    def recommend(self, client_id, k=TOP_K):
+        """Recomendaciones de un cliente (mismo formato que la matriz batch, por score descendente)."""
+        t0 = time.perf_counter()
+        self.counters['requests'] += 1
+        try:
+            state = self._ensure_state()
+            if state is None: return pd.DataFrame()
+            key = (client_id, k)
+            with self._lock:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return self._cache[key].copy()
+
+            df = self._score(state, client_id, k)
+            self.counters['misses'] += 1
+            with self._lock:
+                # Si el estado se ha recargado mientras tanto, este resultado ya no vale para la caché
+                if self._state is state:
+                    self._cache[key] = df
+                    while len(self._cache) > self.cache_size: self._cache.popitem(last=False)
+            return df.copy()
+        except Exception:
+            self.counters['errors'] += 1
+            raise
+        finally:
+            self._observe(time.perf_counter() - t0)
+
+    def reject(self, client_id, product_name):
+        """Registra un descarte en el feedback_log; la siguiente petición del cliente ya re-rankea sin él."""
+        self._ensure_state()
+        entry = pd.DataFrame([{'Client_ID': client_id, 'Product_Name': product_name, 'Action': 'Rejected',
+                               'Date': datetime.now().strftime("%Y-%m-%d")}])
+        with self._lock:
+            append_csv(entry, FILES["feedback_log"])
+            self._rejected[client_id].add(product_name)
+            self._feedback_mtime = _mtime(FILES["feedback_log"])
+            for key in [key for key in self._cache if key[0] == client_id]:
+                del self._cache[key]
+        self.counters['rejections'] += 1
+
+    # --- Métricas ---
+    def _observe(self, seconds):
+        self.latencies.append(seconds)
+        self.histogram[np.searchsorted(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def stats(self):
+        lat = np.array(self.latencies) * 1000
+        out = {k: self.counters[k] for k in ['requests', 'hits', 'misses', 'rejections', 'reloads', 'errors']}
+        out['clientes_en_cache'] = len(self._cache)
+        out['estado_cargado'] = self.loaded_at
+        labels = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        out['histograma_ms'] = dict(zip(labels, self.histogram.tolist()))
+        if len(lat):
+            p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+            out.update({'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3),
+                        'mean_ms': round(lat.mean(), 3), 'max_ms': round(lat.max(), 3)})
+        return out
+
+
+# --- SINGLETON DEL PROCESO ---
+_SERVICE = None
+_SERVICE_LOCK = threading.Lock()
+
+def get_recommendation_service():
+    """Instancia única por proceso (la UI y los scripts comparten estado y caché)."""
+    global _SERVICE
+    with _SERVICE_LOCK:
+        if _SERVICE is None: _SERVICE = RecommendationService()
+        return _SERVICE
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(description="Prueba de carga del recomendador online")
+    parser.add_argument("--requests", type=int, default=2000, help="Peticiones a lanzar")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    service = get_recommendation_service()
+    t0 = time.perf_counter()
+    state = service._ensure_state()
+    if state is None: raise SystemExit("❌ Faltan ventas o catálogo para el recomendador.")
+    print(f"🛰️ Estado cargado en {time.perf_counter() - t0:.2f}s ({len(state['rows'])} clientes)")
+    ids = np.random.default_rng(args.seed).choice(list(state['rows']), args.requests)
+    for client_id in ids: service.recommend(client_id)
+    print(json.dumps(service.stats(), indent=2, ensure_ascii=False))
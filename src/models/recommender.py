@@ -1,9 +1,15 @@
+import json
+import hashlib
 import pandas as pd
 import numpy as np
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import sys
 import os
+from src.utils.config import FILES
+from src.utils.storage import read_table, write_table, iter_table, table_exists, TableWriter
 
 # --- CONFIGURACIÓN DE RUTAS ---
 current_dir = Path(__file__).resolve().parent
@@ -11,19 +17,328 @@ project_root = current_dir.parent.parent
 data_processed = project_root / 'data/processed'
 data_raw = project_root / 'data/raw'
 
-def generate_recommendations():
-    print("🧠 Iniciando Motor de Recomendación Cross-Sell (Content-Based V3.0)...")
-    
+TOP_K = 3                 # Recomendaciones por cliente
+BLOCK_CLIENTS = 2048      # Clientes por bloque (unidad de trabajo de cada proceso)
+BLOCK_CELLS = 4_000_000   # Celdas cliente×producto puntuadas a la vez (acota la memoria por proceso)
+IN_FLIGHT = 2             # Bloques pendientes por proceso: si la escritura va más lenta no se acumulan resultados
+RECS_VERSION = 1          # Subir si cambian las reglas de scoring (invalida el estado del refresco incremental)
+MERGE_BATCH_ROWS = 100_000  # Filas de la matriz guardada que se leen a la vez al fusionar un refresco
+CATALOG_COLUMNS = ['ID', 'Name', 'Category', 'Subcategory', 'Price', 'Margin']  # Columnas del catálogo en la matriz
+
+# Grupos de cluster, en el mismo orden de prioridad que las reglas (el primero que encaja gana)
+CLUSTER_GROUPS = [('VIC', 'Elite'), ('Riesgo', 'Retornadores'), ('Smart', 'Standard'), ('Inactivos', 'Durmientes')]
+# Tramos de ciclo de vida: (Spa urgente, Spa demasiado pronto, Care inmediato)
+LIFECYCLE_STATES = [(1, 0, 0), (0, 1, 1), (0, 1, 0), (0, 0, 0)]
+
+
+def encode_catalog(df_catalog):
+    """
+    Catálogo → arrays NumPy con las señales que usan las reglas (una posición por producto).
+    Las reglas se precalculan como tablas (perfil × producto) que luego solo se indexan:
+    'brand_table' por marca del cliente y 'profile_table' por (grupo de cluster, ciclo de vida).
+    """
+    category = df_catalog['Category'].to_numpy()
+    fit = df_catalog['Sociological_Fit'].to_numpy()
+    price = df_catalog['Price'].to_numpy(dtype=float)
+    brand = df_catalog['Brand_Target'].astype(str).to_numpy()
+    universal = brand == 'Universal'
+    spa = ((category == 'Service') | (df_catalog['Subcategory'] == 'Spa')).to_numpy()
+    care = category == 'Care'
+
+    # A. MATCH DE MARCA (La regla de oro del Lujo): misma marca +200, Universal +40, otra marca -1000
+    brands = list(dict.fromkeys(brand))
+    base = np.where(universal, 40, -1000)
+    brand_table = np.tile(base, (len(brands) + 1, 1))   # última fila: marca fuera del catálogo
+    for code, b in enumerate(brands):
+        brand_table[code, brand == b] = 200
+
+    # C. INTELIGENCIA DE CLUSTER (Personalización): bonus de cada grupo (fila extra: clusters sin regla)
+    group_bonus = np.zeros((len(CLUSTER_GROUPS) + 1, len(df_catalog)), dtype=np.int32)
+    # 💎 VIC / ELITE: aman la joyería y lo exclusivo. Ignoran el precio.
+    group_bonus[0] = (100 * (category == 'Jewelry') + 80 * np.isin(fit, ['Collector', 'Trendsetter', 'VIP'])
+                      + 50 * (price > 400))
+    # 🛡️ RIESGO (Retornadores): evitar productos físicos caros. Empujar Servicios (No devolubles).
+    group_bonus[1] = 200 * (category == 'Service') - 300 * np.isin(category, ['Jewelry', 'Leather Goods'])
+    # 🛍️ SMART SHOPPER / STANDARD: buscan funcionalidad y precio medio.
+    group_bonus[2] = (70 * np.isin(category, ['Care', 'Storage', 'Adornment']) + 50 * (price < 300)
+                      + 40 * np.isin(fit, ['Pragmatic', 'Classic']))
+    # 💤 INACTIVOS: necesitan un "gancho" barato o emocional para volver.
+    group_bonus[3] = 60 * (category == 'Adornment') + 50 * (price < 200)
+
+    # B. MATCH TEMPORAL (Lifecycle), por tramo del cliente:
+    # Spa: >300 días urgencia alta (+150), <60 días demasiado pronto (-100); Care: add-on inmediato (<45 días, +80)
+    lifecycle = np.stack([150 * spa * s_on - 100 * spa * s_early + 80 * care * c_on
+                          for s_on, s_early, c_on in LIFECYCLE_STATES])
+    profile_table = (group_bonus[:, None, :] + lifecycle[None, :, :]).reshape(-1, len(df_catalog))
+
+    # ÍNDICE DE CANDIDATOS (marca → productos de esa marca + Universal, en orden de catálogo).
+    # Con otra marca el score es -1000 + bonus de perfil: si ningún bonus llega a 1000 ese
+    # producto nunca pasa el filtro score > 0 y no hace falta puntuarlo.
+    if profile_table.max(initial=0) - 1000 <= 0:
+        candidates = [np.flatnonzero((brand == b) | universal) for b in brands] + [np.flatnonzero(universal)]
+    else:
+        candidates = [np.arange(len(df_catalog))] * (len(brands) + 1)
+
+    return {
+        'brand': brand, 'brand_codes': {b: k for k, b in enumerate(brands)},
+        'spa': spa, 'care': care,
+        'brand_table': brand_table.astype(np.int32),
+        'profile_table': profile_table.astype(np.int32),
+        'candidates': candidates,
+    }
+
+
+def _lifecycle_state(days_since):
+    """Tramo de ciclo de vida (índice en LIFECYCLE_STATES) según los días desde la última compra."""
+    # >300 días: Spa urgente · <45: Spa pronto + Care · 45-59: Spa pronto · 60-300: ninguna regla
+    return np.select([days_since > 300, days_since < 45, days_since < 60], [0, 1, 2], 3)
+
+
+def encode_clients(client_profiles, items, today):
+    """Perfiles de cliente → arrays NumPy (marca codificada contra el catálogo, días, perfil)."""
+    brands = client_profiles['Marca'].astype(object).where(client_profiles['Marca'].notna(), 'Universal').astype(str).to_numpy()
+    days_since = ((pd.Timestamp(today) - client_profiles['Fecha']) // pd.Timedelta(days=1)).to_numpy()
+
+    cluster = client_profiles['Segmento'].astype(str)
+    group = np.full(len(cluster), len(CLUSTER_GROUPS))
+    for g, keywords in reversed(list(enumerate(CLUSTER_GROUPS))):
+        group[cluster.str.contains('|'.join(keywords), regex=True).to_numpy()] = g
+
+    return {
+        'brand': brands,
+        'brand_code': np.array([items['brand_codes'].get(b, len(items['brand_codes'])) for b in brands]),
+        'days_since': days_since,
+        'profile': group * len(LIFECYCLE_STATES) + _lifecycle_state(days_since),
+    }
+
+
+def encode_context(client_profiles):
+    """Columnas de contexto del cliente que se copian a la matriz (Client_ID, fecha de la última compra)."""
+    return {'Client_ID': client_profiles['Client_ID'].to_numpy(),
+            'Context_Date': client_profiles['Fecha'].dt.strftime('%Y-%m-%d').to_numpy()}
+
+
+def score_matrix(clients, items, rows=slice(None), cols=slice(None)):
+    """Scores (clientes × productos) de las reglas de negocio para un bloque de clientes y un trozo del catálogo (int32)."""
+    scores = items['profile_table'][:, cols][clients['profile'][rows]]
+    scores += items['brand_table'][:, cols][clients['brand_code'][rows]]
+    return scores
+
+
+def top_k(scores, k=TOP_K):
+    """
+    Top-k por fila con argpartition (O(productos) en lugar de ordenar todo el catálogo).
+    Empates: primero el producto que aparece antes en el catálogo (como el orden estable anterior).
+    Devuelve (índices, scores) de forma (filas, k) ordenados de mayor a menor. Reutiliza scores.
+    """
+    n_items = scores.shape[1]
+    k = min(k, n_items)
+    # Clave única score·n + desempate, en el mismo buffer int32 (|score| < 2^31 / n_items)
+    key = scores
+    key *= n_items
+    key += np.arange(n_items - 1, -1, -1, dtype=key.dtype)
+    idx = np.argpartition(key, n_items - k, axis=1)[:, n_items - k:]
+    top = np.take_along_axis(key, idx, axis=1)
+    order = np.argsort(-top, axis=1)
+    idx = np.take_along_axis(idx, order, axis=1)
+    return idx, np.take_along_axis(top, order, axis=1) // n_items
+
+
+def merge_top_k(best, new, n_items, k=TOP_K):
+    """
+    Top-k acumulado: combina el (índices, scores) que se lleva hasta ahora con el de un
+    nuevo trozo del catálogo (índices globales), con el mismo desempate que top_k.
+    """
+    if best is None: return new
+    idx = np.concatenate([best[0], new[0]], axis=1)
+    top = np.concatenate([best[1], new[1]], axis=1)
+    key = top.astype(np.int64) * n_items + (n_items - 1 - idx)
+    order = np.argsort(-key, axis=1)[:, :k]
+    return np.take_along_axis(idx, order, axis=1), np.take_along_axis(top, order, axis=1)
+
+
+def _reasons(clients, items, rows, cols):
+    """Las 2 razones principales de cada recomendación elegida (marca, mantenimiento, cuidado)."""
+    none = np.full(len(rows), '', dtype=object)
+    brand = clients['brand'][rows].astype(object)
+    r_brand = np.where(items['brand'][cols] == brand, 'Colección ' + brand, none)
+    r_spa = np.where(items['spa'][cols] & (clients['days_since'][rows] > 300), 'Mantenimiento Anual', none)
+    r_care = np.where(items['care'][cols] & (clients['days_since'][rows] < 45), 'Cuidado Básico', none)
+    parts = np.stack([r_brand, r_spa, r_care], axis=1)
+    rank = np.cumsum(parts != '', axis=1) * (parts != '')
+    # Concatenar (suma de objetos str) la única razón de cada fila con rango 1 y con rango 2
+    first = np.where(rank == 1, parts, '').sum(axis=1)
+    second = np.where(rank == 2, parts, '').sum(axis=1)
+    return np.where(second != '', first + ' + ' + second, first)
+
+
+# --- POOL DE PROCESOS: cada uno recibe una vez los arrays codificados ---
+_WORKER = None
+
+def _init_worker(clients, items, catalog, context):
+    global _WORKER
+    _WORKER = (clients, items, catalog, context)
+
+
+def block_top_k(clients, items, rows):
+    """
+    Top-K con score > 0 de un bloque de clientes, puntuando solo sus candidatos: los
+    clientes se agrupan por marca y cada grupo recorre su lista del índice en trozos de
+    BLOCK_CELLS celdas con un Top-K acumulado. Devuelve (filas, productos, scores) en
+    orden de cliente y, dentro de cada cliente, de score descendente.
+    """
+    n_items = len(items['brand'])
+    codes = clients['brand_code'][rows]
+    out_rows, out_cols, out_scores, out_rank = [], [], [], []
+    for code in np.unique(codes):
+        group = rows[codes == code]
+        cand = items['candidates'][code]
+        chunk = max(1, BLOCK_CELLS // len(group))
+        best = None
+        for c0 in range(0, len(cand), chunk):
+            cols = cand[c0:c0 + chunk]
+            idx, top = top_k(score_matrix(clients, items, group, cols))
+            best = merge_top_k(best, (cols[idx], top), n_items)
+        if best is None: continue
+        # Filtrado Final: solo scores positivos
+        idx, top = best
+        keep = top > 0
+        out_rows.append(np.broadcast_to(group[:, None], idx.shape)[keep])
+        out_cols.append(idx[keep])
+        out_scores.append(top[keep])
+        out_rank.append(np.broadcast_to(np.arange(idx.shape[1]), idx.shape)[keep])
+    if not out_rows: return (np.array([], dtype=int),) * 3
+
+    rows, cols, scores, rank = (np.concatenate(a) for a in (out_rows, out_cols, out_scores, out_rank))
+    order = np.lexsort((rank, rows))
+    return rows[order], cols[order], scores[order]
+
+
+def recommendation_frame(clients, items, catalog, context, rows, cols, scores):
+    """Filas de la matriz de recomendaciones (una por producto recomendado) para los pares (rows, cols)."""
+    return pd.DataFrame({
+        'Client_ID': context['Client_ID'][rows],
+        'Product_ID': catalog['ID'][cols],
+        'Product_Name': catalog['Name'][cols],
+        'Category': catalog['Category'][cols],
+        'Subcategory': catalog['Subcategory'][cols],
+        'Price': catalog['Price'][cols],
+        'Margin': catalog['Margin'][cols],
+        'Score': scores,
+        'Reason': _reasons(clients, items, rows, cols), # Solo las 2 razones principales
+        'Context_Item': clients['brand'][rows],
+        'Context_Date': context['Context_Date'][rows]
+    })
+
+
+def _recommend_block(bounds):
+    """Recomendaciones de los clientes [start, stop)."""
+    clients, items, catalog, context = _WORKER
+    rows, cols, scores = block_top_k(clients, items, np.arange(*bounds))
+    return recommendation_frame(clients, items, catalog, context, rows, cols, scores)
+
+
+def recommend_blocks(clients, items, catalog, context, workers=None, block=BLOCK_CLIENTS):
+    """
+    Genera las recomendaciones bloque a bloque de block clientes, en orden, repartiendo
+    los bloques en un pool de procesos. Como mucho hay IN_FLIGHT bloques por proceso
+    pendientes de consumir: la memoria no crece con el número de clientes.
+    """
+    n_clients = len(context['Client_ID'])
+    bounds = [(start, min(start + block, n_clients)) for start in range(0, n_clients, block)]
+    workers = min(workers or os.cpu_count(), max(len(bounds), 1))
+    args = (clients, items, catalog, context)
+    if workers <= 1:
+        _init_worker(*args)
+        for b in bounds: yield _recommend_block(b)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=args) as pool:
+        tasks = iter(bounds)
+        pending = deque(pool.submit(_recommend_block, b) for _, b in zip(range(workers * IN_FLIGHT), tasks))
+        while pending:
+            df = pending.popleft().result()
+            b = next(tasks, None)
+            if b is not None: pending.append(pool.submit(_recommend_block, b))
+            yield df
+
+
+# --- REFRESCO INCREMENTAL ---
+def catalog_fingerprint(df_catalog):
+    """Huella del catálogo y de la versión de las reglas: si cambia, todo se recalcula."""
+    digest = hashlib.sha256(repr((RECS_VERSION, TOP_K, list(df_catalog.columns))).encode())
+    digest.update(pd.util.hash_pandas_object(df_catalog, index=False).to_numpy().tobytes())
+    return digest.hexdigest()[:16]
+
+
+def client_state(client_profiles, clients):
+    """
+    Estado de entrada de cada cliente: huella de su última compra y segmento + perfil
+    (grupo de cluster × tramo de ciclo de vida 45/60/300 días). Mientras no cambie,
+    sus recomendaciones tampoco: los días solo cuentan al cruzar un tramo.
+    """
+    fingerprint = pd.util.hash_pandas_object(client_profiles[['Client_ID', 'Marca', 'Fecha', 'Segmento']], index=False)
+    return pd.DataFrame({'Client_ID': client_profiles['Client_ID'].to_numpy(),
+                         'Fingerprint': fingerprint.to_numpy().view(np.int64),
+                         'Profile': clients['profile']})
+
+
+def changed_clients(state, catalog_fp):
+    """
+    Frente al último run: (máscara de clientes a recalcular, cuántos solo cruzaron un
+    tramo de ciclo de vida, Client_IDs que ya no existen). None si no hay un estado
+    válido (otro catálogo o reglas, tablas ausentes) y toca un run completo.
+    """
+    meta_path = FILES["recommendations_meta"]
+    meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+    if meta.get('version') != RECS_VERSION or meta.get('catalog') != catalog_fp: return None
+    if not (table_exists("recommendation_state") and table_exists("recommendations")): return None
+
+    old = read_table("recommendation_state")
+    same_input = pd.MultiIndex.from_frame(state[['Client_ID', 'Fingerprint']]).isin(
+        pd.MultiIndex.from_frame(old[['Client_ID', 'Fingerprint']]))
+    unchanged = pd.MultiIndex.from_frame(state).isin(pd.MultiIndex.from_frame(old[state.columns]))
+    removed = old.loc[~old['Client_ID'].isin(state['Client_ID']), 'Client_ID'].to_numpy()
+    return ~unchanged, int((same_input & ~unchanged).sum()), removed
+
+
+def merge_blocks(drop_ids, df_new, batch_rows=MERGE_BATCH_ROWS):
+    """
+    Matriz guardada sin los clientes de drop_ids + las recomendaciones nuevas, en orden
+    de Client_ID y por bloques de batch_rows (nunca se carga la matriz completa).
+    df_new viene ordenado por cliente y no comparte clientes con lo que se conserva.
+    """
+    drop_ids = pd.Index(drop_ids)
+    new_ids = df_new['Client_ID'].to_numpy()
+    pos = 0
+    for df_old in iter_table("recommendations", batch_rows):
+        end = np.searchsorted(new_ids, df_old['Client_ID'].iloc[-1], side='right')
+        df_old = df_old[~df_old['Client_ID'].isin(drop_ids)]
+        yield pd.concat([df_old, df_new.iloc[pos:end]], ignore_index=True).sort_values('Client_ID', kind='stable')
+        pos = end
+    yield df_new.iloc[pos:]
+
+
+def _save_state(state, catalog_fp):
+    write_table("recommendation_state", state)
+    FILES["recommendations_meta"].write_text(json.dumps({'version': RECS_VERSION, 'catalog': catalog_fp}))
+
+
+def load_client_profiles():
+    """
+    Catálogo y perfil de cada cliente activo (última compra no devuelta + segmento),
+    ordenados por Client_ID. Devuelve (df_catalog, client_profiles, today) o None si faltan datos.
+    """
     # 1. CARGA DE DATOS ROBUSTA
     try:
-        if not (data_processed / 'sales_history.csv').exists():
+        if not table_exists("sales_history"):
             print("❌ Error: No se encuentra sales_history.csv")
-            return
+            return None
         if not (data_raw / 'accessories_catalog.csv').exists():
             print("❌ Error: No se encuentra accessories_catalog.csv (Ejecuta create_catalog.py primero)")
-            return
+            return None
 
-        df_sales = pd.read_csv(data_processed / 'sales_history.csv')
+        df_sales = read_table("sales_history", columns=['Fecha', 'Marca', 'Status', 'Client_ID'])
         df_catalog = pd.read_csv(data_raw / 'accessories_catalog.csv')
         
         # Intentar cargar clusters, si falla, crear dummy
@@ -42,7 +357,7 @@ def generate_recommendations():
             
     except Exception as e:
         print(f"❌ Error crítico cargando datos: {e}")
-        return
+        return None
 
     # Normalización de fechas
     df_sales['Fecha'] = pd.to_datetime(df_sales['Fecha'], errors='coerce')
@@ -63,115 +378,81 @@ def generate_recommendations():
     else:
         client_profiles['Segmento'] = 'Standard'
     
-    recommendations_list = []
-    
+    # Orden de salida (por cliente) fijado de antemano: los bloques se escriben tal cual llegan
+    client_profiles = client_profiles.sort_values('Client_ID', kind='stable').reset_index(drop=True)
+    return df_catalog, client_profiles, today
+
+
+def generate_recommendations(workers=None, block=BLOCK_CLIENTS, incremental=False):
+    print("🧠 Iniciando Motor de Recomendación Cross-Sell (Content-Based V3.0)...")
+    loaded = load_client_profiles()
+    if loaded is None: return
+    df_catalog, client_profiles, today = loaded
     print(f"   ⚙️ Calculando afinidad para {len(client_profiles)} clientes activos...")
 
-    # 3. MOTOR DE SCORING (CORE)
-    for _, client in client_profiles.iterrows():
-        c_id = client['Client_ID']
-        last_brand = client['Marca'] if pd.notna(client['Marca']) else 'Universal'
-        days_since = (today - client['Fecha']).days
-        cluster = str(client['Segmento'])
-        
-        # Iteramos sobre todo el catálogo para puntuar cada ítem
-        for _, item in df_catalog.iterrows():
-            score = 0
-            reasons = []
-            
-            # --- A. MATCH DE MARCA (La regla de oro del Lujo) ---
-            # Si compraste Hermès, quieres accesorios Hermès.
-            if item['Brand_Target'] == last_brand:
-                score += 200
-                reasons.append(f"Colección {last_brand}")
-            elif item['Brand_Target'] == 'Universal':
-                score += 40 # Siempre suma, es seguro
-            else:
-                score -= 1000 # PENALIZACIÓN: No recomendar accesorios Gucci a un cliente Chanel
-            
-            # --- B. MATCH TEMPORAL (Lifecycle) ---
-            # Servicios de Mantenimiento (Spa)
-            if item['Category'] == 'Service' or item['Subcategory'] == 'Spa':
-                if days_since > 300: 
-                    score += 150 # Urgencia alta
-                    reasons.append("Mantenimiento Anual")
-                elif days_since < 60:
-                    score -= 100 # Demasiado pronto
-            
-            # Productos de Cuidado (Add-on inmediato)
-            if item['Category'] == 'Care' and days_since < 45:
-                score += 80 
-                reasons.append("Cuidado Básico")
+    # 3. MOTOR DE SCORING (CORE): bloques de clientes en paralelo, solo sobre sus candidatos + Top-K con argpartition
+    items = encode_catalog(df_catalog)
+    clients = encode_clients(client_profiles, items, today)
+    n_candidates = np.array([len(c) for c in items['candidates']])[clients['brand_code']]
+    if len(n_candidates): print(f"   🗂️ Índice de candidatos: {n_candidates.mean():.0f} productos por cliente de media (de {len(df_catalog)})")
+    catalog = {c: df_catalog[c].to_numpy() for c in CATALOG_COLUMNS}
+    context = encode_context(client_profiles)
+    state, catalog_fp = client_state(client_profiles, clients), catalog_fingerprint(df_catalog)
+    del client_profiles
 
-            # --- C. INTELIGENCIA DE CLUSTER (Personalización) ---
-            
-            # 💎 VIC / ELITE
-            if "VIC" in cluster or "Elite" in cluster:
-                # Aman la joyería y lo exclusivo. Ignoran el precio.
-                if item['Category'] == 'Jewelry': score += 100
-                if item['Sociological_Fit'] in ['Collector', 'Trendsetter', 'VIP']: score += 80
-                if item['Price'] > 400: score += 50
-            
-            # 🛡️ RIESGO (Retornadores)
-            elif "Riesgo" in cluster or "Retornadores" in cluster:
-                # Evitar productos físicos caros. Empujar Servicios (No devolubles).
-                if item['Category'] == 'Service': score += 200
-                if item['Category'] in ['Jewelry', 'Leather Goods']: score -= 300
-            
-            # 🛍️ SMART SHOPPER / STANDARD
-            elif "Smart" in cluster or "Standard" in cluster:
-                # Buscan funcionalidad y precio medio.
-                if item['Category'] in ['Care', 'Storage', 'Adornment']: score += 70
-                if item['Price'] < 300: score += 50
-                if item['Sociological_Fit'] in ['Pragmatic', 'Classic']: score += 40
-
-            # 💤 INACTIVOS
-            elif "Inactivos" in cluster or "Durmientes" in cluster:
-                # Necesitan un "gancho" barato o emocional para volver.
-                if item['Category'] == 'Adornment': score += 60 # Algo bonito (Twilly, Charm)
-                if item['Price'] < 200: score += 50 # Barrera de entrada baja
-
-            # Filtrado Final
-            if score > 0:
-                recommendations_list.append({
-                    'Client_ID': c_id,
-                    'Product_ID': item['ID'],
-                    'Product_Name': item['Name'],
-                    'Category': item['Category'],
-                    'Subcategory': item['Subcategory'],
-                    'Price': item['Price'],
-                    'Margin': item['Margin'],
-                    'Score': score,
-                    'Reason': " + ".join(reasons[:2]), # Solo las 2 razones principales
-                    'Context_Item': last_brand,
-                    'Context_Date': client['Fecha'].strftime('%Y-%m-%d')
-                })
-    
-    # 4. RANKING Y EXPORTACIÓN
-    df_recs = pd.DataFrame(recommendations_list)
-    
-    if not df_recs.empty:
-        # Ordenar por Cliente y Score descendente
-        df_recs = df_recs.sort_values(['Client_ID', 'Score'], ascending=[True, False])
-        
-        # Diversificación: Intentar no mostrar 3 productos iguales si es posible
-        # (Lógica simplificada: tomamos el Top 3 directo para este MVP)
-        df_final = df_recs.groupby('Client_ID').head(3)
-        
-        output_path = data_processed / 'recommendations_matrix.csv'
-        df_final.to_csv(output_path, index=False)
-        
+    # Refresco incremental: solo clientes con compra/segmento nuevos o que han cruzado un tramo
+    changes = changed_clients(state, catalog_fp) if incremental else None
+    if incremental and changes is None:
+        print("   🔁 Sin estado válido del último run (catálogo o reglas distintos): cálculo completo.")
+    if changes is not None:
+        mask, crossed, removed = changes
+        print(f"   🔁 Refresco incremental: {mask.sum()} clientes a recalcular ({crossed} por cambio de tramo), "
+              f"{len(removed)} eliminados, {len(mask) - mask.sum()} sin cambios")
+        if not mask.any() and not len(removed):
+            print("✅ Recomendaciones al día: nada que recalcular.")
+            return
+        clients = {k: v[mask] for k, v in clients.items()}
+        context = {k: v[mask] for k, v in context.items()}
+
+    # 4. RANKING Y EXPORTACIÓN: cada bloque sale ya ordenado (cliente, score) y se escribe al llegar
+    # (Diversificación: tomamos el Top 3 directo para este MVP)
+    blocks = recommend_blocks(clients, items, catalog, context, workers, block)
+    if changes is not None:
+        # Lo recalculado es proporcional a la actividad del día; la matriz guardada se fusiona por bloques
+        recalculated = [df for df in blocks if not df.empty]
+        df_new = pd.concat(recalculated, ignore_index=True) if recalculated else pd.DataFrame(columns=['Client_ID'])
+        blocks = merge_blocks(np.concatenate([context['Client_ID'], removed]), df_new)
+
+    # CSV siempre: la página de Cross-Selling lee la exportación
+    n_recs, n_clients, sample, last_id = 0, 0, None, None
+    with TableWriter("recommendations", export_csv=True) as out:
+        for df_block in blocks:
+            if df_block.empty: continue
+            out.write(df_block)
+            n_recs += len(df_block)
+            # Un cliente puede quedar partido entre dos bloques de la matriz fusionada
+            n_clients += df_block['Client_ID'].nunique() - (df_block['Client_ID'].iloc[0] == last_id)
+            last_id = df_block['Client_ID'].iloc[-1]
+            if sample is None: sample = df_block.iloc[0]
+
+    if n_recs:
         print(f"✅ ¡Éxito! Matriz de Recomendación generada.")
-        print(f"   📊 Recomendaciones totales: {len(df_final)}")
-        print(f"   👤 Clientes cubiertos: {df_final['Client_ID'].nunique()}")
-        print(f"   💾 Guardado en: {output_path}")
+        print(f"   📊 Recomendaciones totales: {n_recs}")
+        print(f"   👤 Clientes cubiertos: {n_clients}")
+        print(f"   💾 Guardado en: {FILES['recommendations']}")
         
         # Muestra de control
-        sample = df_final.iloc[0]
         print(f"   🔎 Ejemplo: Al cliente {sample['Client_ID']} (Contexto: {sample['Context_Item']}) -> {sample['Product_Name']} (Score: {sample['Score']})")
+        _save_state(state, catalog_fp)
         
     else:
         print("⚠️ Advertencia: No se generaron recomendaciones. Revisa si hay coincidencia de marcas entre Ventas y Catálogo.")
 
 if __name__ == "__main__":
-    generate_recommendations()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description="Motor de recomendación cross-sell por bloques")
+    parser.add_argument("--workers", type=int, default=None, help="Procesos (por defecto, todos los núcleos)")
+    parser.add_argument("--block", type=int, default=BLOCK_CLIENTS, help="Clientes por bloque")
+    parser.add_argument("--incremental", action="store_true", help="Recalcular solo los clientes con cambios desde el último run")
+    args = parser.parse_args()
+    generate_recommendations(args.workers, args.block, args.incremental)
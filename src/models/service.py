@@ -0,0 +1,201 @@
+import json
+import threading
+import time
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from src.models.inference import (MODELS_PATH, apply_scenario, forecast_cache_key,
+                                  load_artifact, load_base_forecast)
+
+WATCH_INTERVAL = 2.0     # Segundos entre comprobaciones del artefacto en disco
+BASE_KEEP = 8            # Horizontes base que se conservan en memoria
+LATENCY_WINDOW = 2000    # Peticiones recientes para los percentiles de latencia
+
+
+class ForecastService:
+    """
+    Servicio de forecast de larga vida: mantiene los modelos cargados, vigila el
+    artefacto en disco (recarga en caliente si cambia) y responde cualquier
+    horizonte y multiplicadores reescalando el forecast base.
+
+        service = get_forecast_service()
+        df = service.forecast(weeks_ahead=26, marketing_boost=1.3, competitor_impact=0.92)
+
+    Peticiones simultáneas del mismo horizonte se agrupan: solo una calcula el
+    base y el resto espera su resultado. stats() da contadores y latencias.
+    """
+
+    def __init__(self, watch_interval=WATCH_INTERVAL, latency_window=LATENCY_WINDOW):
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()
+        self._model = None            # (artefacto, sha256 de sus bytes): se sustituyen siempre juntos
+        self._signature = None
+        self._checked_at = 0.0
+        self._bases = OrderedDict()   # clave de caché -> forecast base (LRU)
+        self._inflight = {}           # clave de caché -> Future del cálculo en curso
+        self.latencies = deque(maxlen=latency_window)
+        self.counters = defaultdict(int)
+        self.loaded_at = None
+
+    # --- Modelo ---
+    def _ensure_model(self):
+        """(artefacto, hash) vigentes; como mucho una comprobación de disco cada watch_interval."""
+        now = time.monotonic()
+        if self._model is not None and now - self._checked_at < self.watch_interval:
+            return self._model
+        with self._lock:
+            self._checked_at = now
+            stat = MODELS_PATH.stat() if MODELS_PATH.exists() else None
+            signature = (stat.st_size, stat.st_mtime_ns) if stat else None
+            if signature is not None and signature != self._signature:
+                loaded = load_artifact(with_hash=True)
+                if loaded is not None:
+                    if self._signature is not None:
+                        print(f"🔄 [SERVICE] Modelo actualizado en disco, recargado ({MODELS_PATH.name})")
+                    self._model, self._signature = loaded, signature
+                    self._bases.clear()
+                    self.loaded_at = time.time()
+                    self.counters['reloads'] += 1
+        return self._model
+
+    # --- Forecast ---
+    def base(self, weeks_ahead=52):
+        """Forecast base del horizonte pedido (memoria → caché en disco → cálculo, agrupando peticiones)."""
+        model = self._ensure_model()
+        if model is None: return load_base_forecast(weeks_ahead)
+        # Clave del modelo realmente cargado (no del disco, que puede ir por delante)
+        artifact, model_hash = model
+        key = forecast_cache_key(weeks_ahead, model_hash)
+
+        with self._lock:
+            if key in self._bases:
+                self._bases.move_to_end(key)
+                self.counters['hits'] += 1
+                return self._bases[key]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+            else:
+                self.counters['coalesced'] += 1
+
+        if not owner: return future.result()
+        try:
+            df_base = load_base_forecast(weeks_ahead, artifact=artifact, model_hash=model_hash)
+            self.counters['misses'] += 1
+            future.set_result(df_base)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        if not df_base.empty:
+            with self._lock:
+                self._bases[key] = df_base
+                while len(self._bases) > BASE_KEEP: self._bases.popitem(last=False)
+        return df_base
+
+    def forecast(self, weeks_ahead=52, marketing_boost=1.0, competitor_impact=1.0, level='Cluster'):
+        """Escenario completo (mismo formato que run_forecast) sin tocar forecast_horizon."""
+        t0 = time.perf_counter()
+        self.counters['requests'] += 1
+        try:
+            return apply_scenario(self.base(weeks_ahead), marketing_boost, competitor_impact, level)
+        except Exception:
+            self.counters['errors'] += 1
+            raise
+        finally:
+            self.latencies.append(time.perf_counter() - t0)
+
+    # --- Métricas ---
+    def stats(self):
+        lat = np.array(self.latencies) * 1000
+        out = {k: self.counters[k] for k in ['requests', 'hits', 'misses', 'coalesced', 'reloads', 'errors']}
+        out['bases_en_memoria'] = len(self._bases)
+        out['modelo_cargado'] = self.loaded_at
+        if len(lat):
+            p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+            out.update({'p50_ms': round(p50, 3), 'p95_ms': round(p95, 3), 'p99_ms': round(p99, 3),
+                        'mean_ms': round(lat.mean(), 3), 'max_ms': round(lat.max(), 3)})
+        return out
+
+
+# --- SINGLETON DEL PROCESO ---
+_SERVICE = None
+_SERVICE_LOCK = threading.Lock()
+
+def get_forecast_service():
+    """Instancia única por proceso (UI, scripts y endpoint HTTP comparten modelos y caché)."""
+    global _SERVICE
+    with _SERVICE_LOCK:
+        if _SERVICE is None: _SERVICE = ForecastService()
+        return _SERVICE
+
+
+# --- ENDPOINT HTTP LOCAL (opcional) ---
+def _make_handler(service):
+    class ForecastHandler(BaseHTTPRequestHandler):
+        def _send(self, code, body):
+            payload = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            if url.path == '/health':
+                return self._send(200, {'ok': service._ensure_model() is not None})
+            if url.path == '/stats':
+                return self._send(200, service.stats())
+            if url.path != '/forecast':
+                return self._send(404, {'error': f"Ruta desconocida: {url.path}"})
+            try:
+                weeks = int(query.get('weeks', 52))
+                marketing = float(query.get('marketing', 1.0))
+                competition = float(query.get('competition', 1.0))
+            except ValueError as e:
+                return self._send(400, {'error': str(e)})
+            try:
+                df = service.forecast(weeks, marketing, competition, query.get('level', 'Cluster'))
+            except Exception as e:
+                return self._send(500, {'error': str(e)})
+            if 'cluster' in query: df = df[df['Cluster'] == query['cluster']]
+            return self._send(200, df.to_json(orient='records', date_format='iso'))
+
+        def log_message(self, format, *args):
+            pass  # Sin log por petición: las latencias van a /stats
+
+    return ForecastHandler
+
+
+def serve(host="127.0.0.1", port=8765, service=None):
+    """Expone el servicio en HTTP local: /forecast?weeks=&marketing=&competition=&level=&cluster=, /stats, /health."""
+    service = service or get_forecast_service()
+    service._ensure_model()
+    server = ThreadingHTTPServer((host, port), _make_handler(service))
+    print(f"🛰️ Servicio de forecast escuchando en http://{host}:{port} (Ctrl+C para parar)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Servicio detenido.")
+    finally:
+        server.server_close()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Servicio local de forecast con recarga en caliente")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -16,6 +16,7 @@ if str(project_root) not in sys.path:
 # --- IMPORTACIONES ---
 try:
     from src.ui.common import setup_page_config, load_data
+    from src.utils.config import settings
     from src.rag.engine import LuxuryAssistant
     # IMPORTAMOS EL COMPONENTE DE AURA QUE CREAMOS ANTES
     from src.ui.aura_component import render_aura 
@@ -82,7 +83,7 @@ with st.sidebar:
         
         # MAPEO DE NOMBRES
         cluster_map = {
-            'High_End': 'High End (Hermès, Chanel)', 
+            'High_End': f"High End ({', '.join(settings['tier_1_brands'])})", 
             'Standard': 'Standard (Gucci, Prada)'
         }
         rev_map = {v: k for k, v in cluster_map.items()}
@@ -29,23 +29,23 @@ except ImportError:
 # --- 2. CARGA DE DATOS (Tu código original intacto) ---
 @st.cache_data
 def load_data():
-    root = get_project_root()
+    from src.utils.storage import read_table, table_exists
     data = {}
     
-    paths = {
-        'forecast': root / "data/processed/forecast_horizon.csv",
-        'macro': root / "data/processed/macro_indicators.csv",
-        'sales': root / "data/processed/sales_history.csv",
-        'metrics': root / "data/processed/daily_metrics.csv",
-        'inventory': root / "data/processed/inventory_state.csv",
-        'clients': root / "data/processed/clients_state.csv"
+    # Clave del dashboard -> tabla de config.FILES (Parquet tipado si existe, CSV si no)
+    tables = {
+        'forecast': "forecast",
+        'macro': "macro_indicators",
+        'sales': "sales_history",
+        'metrics': "daily_metrics",
+        'inventory': "inventory",
+        'clients': "clients_state"
     }
 
-    for key, path in paths.items():
-        if path.exists():
+    for key, table in tables.items():
+        if table_exists(table):
             try:
-                # Intentamos leer con separador automático o coma
-                df = pd.read_csv(path, sep=None, engine='python')
+                df = read_table(table)
                 if 'Fecha' in df.columns: 
                     df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
                 data[key] = df
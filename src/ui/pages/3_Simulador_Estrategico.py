@@ -22,6 +22,7 @@ if str(project_root) not in sys.path:
     sys.path.append(str(project_root))
 
 from src.ui.common import load_data
+from src.utils.config import settings
 
 st.set_page_config(page_title="Simulador Estratégico", layout="wide")
 
@@ -87,6 +88,15 @@ def run_simulation(df_base, mkt_boost_pct, comp_aggressiveness):
     
     return df_sim, extra_mkt_cost, base_mkt_budget
 
+# --- SERVICIO DE FORECAST (modelos en memoria, recarga en caliente) ---
+@st.cache_resource
+def get_service():
+    try:
+        from src.models.service import get_forecast_service
+        return get_forecast_service()
+    except Exception:
+        return None
+
 # --- CARGA ---
 db = load_data()
 df_forecast = db.get('forecast')
@@ -96,9 +106,19 @@ with st.sidebar:
     st.markdown("### HERAS PURSE AI")
     st.caption("Intelligence Suite V25")
     
+    # Horizonte a medida desde el servicio; si no hay modelo, el forecast guardado
+    service = get_service()
+    if service is not None:
+        horizon = st.slider("Horizonte (semanas)", 4, 104, 52, step=4)
+        try:
+            df_live = service.forecast(weeks_ahead=horizon)
+            if not df_live.empty: df_forecast = df_live
+        except Exception:
+            pass
+    
     if df_forecast is not None:
         cluster_map = {
-            'High_End': 'High End (Hermès, Chanel)', 
+            'High_End': f"High End ({', '.join(settings['tier_1_brands'])})", 
             'Standard': 'Standard (Gucci, Prada)'
         }
         rev_map = {v: k for k, v in cluster_map.items()}
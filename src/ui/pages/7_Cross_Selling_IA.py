@@ -147,9 +147,23 @@ def load_data_engine():
         st.error(f"Error técnico cargando datos: {e}")
         return None, None
 
+@st.cache_resource
+def get_reco_service():
+    try:
+        from src.models.recommendation_service import get_recommendation_service
+        return get_recommendation_service()
+    except Exception:
+        return None
+
 # --- SISTEMA DE MEMORIA (FEEDBACK LOOP) ---
 def save_rejection(client_id, product_name):
     """Guarda en un CSV persistente que este cliente rechazó este producto."""
+    reco_service = get_reco_service()
+    if reco_service is not None:
+        # El servicio lo registra en el mismo log y re-rankea al cliente en la siguiente petición
+        reco_service.reject(client_id, product_name)
+        return
+
     feedback_path = project_root / 'data/processed/feedback_log.csv'
     
     # Crear archivo si no existe
@@ -254,10 +268,18 @@ st.title("AI Sales Terminal")
 st.markdown("Plataforma de inteligencia comercial y activación de cross-selling.")
 
 if current_client_id:
-    # Cargar recomendaciones y filtrar las rechazadas (MEMORIA)
+    # Cargar recomendaciones sin las rechazadas (MEMORIA)
     raw_recs = df_recs[df_recs['Client_ID'] == current_client_id].copy()
-    rejected_list = get_rejected_products(current_client_id)
-    active_recs = raw_recs[~raw_recs['Product_Name'].isin(rejected_list)]
+    reco_service = get_reco_service()
+    try:
+        # Scoring en vivo: los descartes se excluyen antes del Top-K y su hueco lo ocupa el siguiente mejor
+        active_recs = reco_service.recommend(current_client_id) if reco_service is not None else None
+    except Exception:
+        active_recs = None
+    if active_recs is None:
+        # Sin servicio: matriz batch filtrada al mostrarla
+        rejected_list = get_rejected_products(current_client_id)
+        active_recs = raw_recs[~raw_recs['Product_Name'].isin(rejected_list)]
     
     # Header Cliente
     st.markdown(f"""
@@ -16,13 +16,27 @@ MODEL_FILE = MODELS_DIR / "xgboost_quantile.joblib"
 # 4. Archivos Específicos
 FILES = {
     "catalog": RAW_DATA_PATH / "luxury_handbags.csv",
+    "accessories": RAW_DATA_PATH / "accessories_catalog.csv",
     "clients_base": RAW_DATA_PATH / "clients.csv",
     "inventory": PROCESSED_DATA_PATH / "inventory_state.csv",
     "clients_state": PROCESSED_DATA_PATH / "clients_state.csv",
     "sales_history": PROCESSED_DATA_PATH / "sales_history.csv",
     "macro_indicators": PROCESSED_DATA_PATH / "macro_indicators.csv",
     "forecast": PROCESSED_DATA_PATH / "forecast_horizon.csv",
-    "daily_metrics": PROCESSED_DATA_PATH / "daily_metrics.csv"
+    "daily_metrics": PROCESSED_DATA_PATH / "daily_metrics.csv",
+    "monte_carlo": PROCESSED_DATA_PATH / "monte_carlo_summary.csv",
+    "clients_clusters": PROCESSED_DATA_PATH / "clients_clusters.csv",
+    "recommendations": PROCESSED_DATA_PATH / "recommendations_matrix.csv",
+    "recommendation_state": PROCESSED_DATA_PATH / "recommendations_state.csv",
+    "recommendations_meta": PROCESSED_DATA_PATH / "recommendations_state.json",
+    "feedback_log": PROCESSED_DATA_PATH / "feedback_log.csv",
+    "checkpoint": PROCESSED_DATA_PATH / "checkpoint",
+    "profile_trace": PROCESSED_DATA_PATH / "profile_trace.folded",
+    "forecast_cache": PROCESSED_DATA_PATH / "forecast_cache",
+    "backtest": PROCESSED_DATA_PATH / "backtest_results.csv",
+    "backtest_cache": PROCESSED_DATA_PATH / "backtest_cache",
+    "weekly_features": PROCESSED_DATA_PATH / "weekly_features.csv",
+    "feature_store_meta": PROCESSED_DATA_PATH / "weekly_features.json"
 }
 
 # 5. Crear directorios
@@ -35,6 +49,10 @@ settings = {
     "simulation_days": 730,
     "traffic_mean": 90,
     "traffic_std": 5,
+    "export_csv": True,                   # Además del Parquet, exportar CSV (compatibilidad)
+    "stream_chunk_rows": 50_000,          # Filas por bloque al volcar ventas en streaming
+    "online_channels": ['E-Commerce', 'Instagram Shop', 'Busca Chollos'],  # Clientes que también compran en la tienda Online
+    "reconcile_every": 7,                 # Días entre conciliaciones de la simulación multi-tienda
     "RAW_DATA_PATH": RAW_DATA_PATH,       # Añadido para compatibilidad
     "PROCESSED_DATA_PATH": PROCESSED_DATA_PATH # Añadido para compatibilidad
 }
\ No newline at end of file
@@ -1,33 +1,95 @@
 import pandas as pd
 import numpy as np
-import random
 import re
+import os
+import json
+import copy
 from datetime import datetime, timedelta
 from pathlib import Path
 # CAMBIO CLAVE: Importamos FILES y settings directamente
 from .config import settings, FILES
+from .inventory import InventoryStore
+from .scenarios import generate_macro_context
+from .storage import read_table, write_table, append_table, append_csv, table_exists
+from .streaming import SimulationSink
+from .profiling import SimProfiler
 
 class DataLoader:
-    def __init__(self):
+    def __init__(self, seed=None, rng=None):
+        """
+        seed / rng: toda la aleatoriedad del simulador sale de un único
+        numpy.random.Generator, así que una semilla reproduce la ejecución
+        completa. Para trabajos paralelos usar self.rng.spawn(n).
+        """
+        self.rng = rng if rng is not None else np.random.default_rng(seed)
+
         # --- RUTAS (Ahora usamos FILES que es mucho más seguro) ---
         self.catalog_path = FILES["catalog"]
         self.clients_base_path = FILES["clients_base"]
         self.inventory_state_path = FILES["inventory"]
         self.clients_state_path = FILES["clients_state"]
         self.metrics_path = FILES["daily_metrics"]
+        self.checkpoint_dir = FILES["checkpoint"]
         
         self.TIER_1_BRANDS = settings["tier_1_brands"]
         self.daily_metrics_buffer = []
+        # Escala del run (una tienda de la simulación multi-tienda usa una fracción)
+        self.traffic_mean = settings.get("traffic_mean", 90) # Uso seguro de dict
+        self.restock_scale = 1.0
+        # Instrumentación por fases (apagada: coste prácticamente nulo). Ver run_simulation.py --profile
+        self.profiler = SimProfiler()
 
         # Cargar datos maestros
         self.catalog_templates = self._load_robust_csv(self.catalog_path)
-        self.clients = self._load_robust_csv(self.clients_state_path if self.clients_state_path.exists() else self.clients_base_path)
+        self.clients = read_table("clients_state") if table_exists("clients_state") else self._load_robust_csv(self.clients_base_path)
         self._ensure_stratified_wallets()
 
-        if self.inventory_state_path.exists():
-            self.live_inventory = pd.read_csv(self.inventory_state_path)
-        else:
-            self.live_inventory = pd.DataFrame()
+        # Inventario en columnas NumPy (ver InventoryStore); solo se exporta a DataFrame al guardar
+        self._template_prices = self.catalog_templates['Precio_Venta_EUR'].apply(self._clean_price).to_numpy() if 'Precio_Venta_EUR' in self.catalog_templates.columns else np.zeros(len(self.catalog_templates))
+        self._reset_inventory(read_table("inventory") if table_exists("inventory") else None)
+
+    def _reset_inventory(self, frame=None):
+        self.inventory = InventoryStore(self.catalog_templates, self._template_prices)
+        if frame is not None: self.inventory.load_frame(frame)
+        self._index_affinities()
+
+    def _index_affinities(self):
+        """
+        Matriz booleana cliente×marca alineada con los códigos de marca del inventario.
+        Brand_Affinity ('Fendi | Louis Vuitton (Monogram)') se parsea una sola vez por
+        tokens exactos (sin el calificativo entre paréntesis), así 'Dior' no casa por
+        subcadena dentro de otra marca y la consulta es un simple indexado.
+        """
+        brand_pos = {b: i for i, b in enumerate(self.inventory.brand_names)}
+        n = len(self.clients)
+        self.brand_affinity = np.zeros((n, len(brand_pos)), dtype=bool)
+        if n == 0 or 'Brand_Affinity' not in self.clients.columns: return
+
+        tokens = self.clients['Brand_Affinity'].fillna('').astype(str).reset_index(drop=True).str.split('|').explode()
+        tokens = tokens.str.replace(r'\(.*\)', '', regex=True).str.strip()
+        codes = tokens.map(brand_pos)
+        valid = codes.notna().to_numpy()
+        self.brand_affinity[tokens.index.to_numpy()[valid], codes.to_numpy()[valid].astype(int)] = True
+
+    def shard(self, client_rows, weight=1.0, seed=None):
+        """
+        Copia del simulador para una sola tienda / canal: un subconjunto de clientes,
+        inventario propio vacío y una fracción (weight) del tráfico y la reposición.
+        Catálogo y configuración se comparten con el original.
+        """
+        shard = copy.copy(self)
+        shard.rng = np.random.default_rng(seed)
+        shard.clients = self.clients.iloc[client_rows].reset_index(drop=True).copy()
+        shard.daily_metrics_buffer = []
+        shard.traffic_mean = max(1, round(self.traffic_mean * weight))
+        shard.restock_scale = weight
+        shard._reset_inventory()
+        return shard
+
+    @property
+    def live_inventory(self):
+        """Vista DataFrame del inventario (materializa todas las filas: no usar en bucles)."""
+        return self.inventory.to_frame()
 
     def _load_robust_csv(self, path):
         if not path.exists(): return pd.DataFrame()
@@ -48,107 +110,351 @@ class DataLoader:
         """Asigna presupuestos realistas: Aspiracionales, Recurrentes y VIPs."""
         if self.clients.empty: return
         
-        def assign_budget():
-            rand = random.random()
-            if rand < 0.65: return random.randint(3500, 9000)   # Aspiracional (Standard)
-            if rand < 0.92: return random.randint(15000, 40000) # Lujo Recurrente
-            return random.randint(60000, 200000)                # VIP (High End)
-
         if 'Current_Budget' not in self.clients.columns:
-            self.clients['Fashion_Wallet'] = [assign_budget() for _ in range(len(self.clients))]
+            n = len(self.clients)
+            rand = self.rng.random(n)
+            budgets = np.where(rand < 0.65, self.rng.integers(3500, 9001, n),        # Aspiracional (Standard)
+                      np.where(rand < 0.92, self.rng.integers(15000, 40001, n),      # Lujo Recurrente
+                               self.rng.integers(60000, 200001, n)))                 # VIP (High End)
+            self.clients['Fashion_Wallet'] = budgets
             self.clients['Current_Budget'] = self.clients['Fashion_Wallet']
             self.clients['Purchases_Count'] = 0
 
     def _restock_inventory(self, date, volume=15):
         if self.catalog_templates.empty: return
-        new_items = self.catalog_templates.sample(n=volume, replace=True).copy()
-        new_items['ID_Serial_Unico'] = [f"SN-{random.randint(1000000, 9999999)}" for _ in range(len(new_items))]
-        new_items['Date_Added'] = date
-        new_items['Days_On_Market'] = 0
-        new_items['Status'] = 'Available'
-        new_items['Current_Price'] = new_items['Precio_Venta_EUR'].apply(self._clean_price)
-        new_items['COGS'] = new_items['Current_Price'] * 0.55
-        self.live_inventory = pd.concat([self.live_inventory, new_items], ignore_index=True)
-
-    def _calculate_affinity(self, client, product, econ_idx):
-        """Calcula probabilidad de compra democrática."""
-        price = product['Current_Price']
-        budget = client['Current_Budget']
-        is_tier_1 = product['Marca'] in self.TIER_1_BRANDS
-        
+        template_idx = self.rng.integers(0, len(self.catalog_templates), size=volume)
+        serials = self.rng.integers(1000000, 10000000, size=volume)
+        self.inventory.restock(template_idx, serials, date)
+
+    def _calculate_affinity(self, budget, price, is_tier_1, brand_match, econ_idx):
+        """Calcula probabilidad de compra democrática (vectorizado por candidato)."""
         # Filtro de crisis
-        psych_factor = 1.15 if (econ_idx < 0.9 and is_tier_1) else (0.65 if econ_idx < 0.9 else 1.05)
-        
-        if price > budget: return 0
-        
-        score = 45 
-        if str(product['Marca']) in str(client.get('Brand_Affinity', '')):
-            score += 40
-        
-        return score * psych_factor
+        if econ_idx < 0.9:
+            psych_factor = np.where(is_tier_1, 1.15, 0.65)
+        else:
+            psych_factor = np.full(len(price), 1.05)
 
-    def _save_state(self):
+        score = np.where(brand_match, 85.0, 45.0) * psych_factor
+        return np.where(price > budget, 0.0, score)
+
+    def _save_state(self, write_metrics=True):
         """Guarda el progreso del simulador."""
-        self.live_inventory.to_csv(self.inventory_state_path, index=False)
-        self.clients.to_csv(self.clients_state_path, index=False)
-        
-        if self.daily_metrics_buffer:
-            df_metrics = pd.DataFrame(self.daily_metrics_buffer)
-            df_metrics.to_csv(self.metrics_path, index=False)
+        with self.profiler.phase('save_state'):
+            write_table("inventory", self.inventory.to_frame())
+            write_table("clients_state", self.clients)
 
-    def generate_sales_data(self, days=365, macro_df=None):
-        traffic_mean = settings.get("traffic_mean", 90) # Uso seguro de dict
-        print(f"💼 Ejecutando Simulador V25 (Tráfico ~{traffic_mean}/día)...")
-        
-        start_date = datetime.today() - timedelta(days=days)
-        if self.live_inventory.empty: self._restock_inventory(start_date, volume=350)
+            if write_metrics and self.daily_metrics_buffer:
+                df_metrics = pd.DataFrame(self.daily_metrics_buffer)
+                write_table("daily_metrics", df_metrics)
+
+    # --- CHECKPOINTS ---
+    def _checkpoint_file(self, name):
+        return self.checkpoint_dir / name
+
+    def _read_checkpoint(self):
+        path = self._checkpoint_file('state.json')
+        if not path.exists(): return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_checkpoint(self, meta, sales_rows=None):
+        """
+        Checkpoint del run en curso: inventario, clientes, métricas, ventas, estado
+        del RNG y última fecha simulada. Ventas y métricas se añaden en modo append
+        (solo las filas nuevas); state.json se escribe al final y es el que manda.
+        """
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        self.profiler.count('checkpoints')
+
+        if not meta['complete']:
+            for name, df in [('inventory_state.csv', self.inventory.to_frame()), ('clients_state.csv', self.clients)]:
+                tmp = self._checkpoint_file(name + '.tmp')
+                df.to_csv(tmp, index=False)
+                os.replace(tmp, self._checkpoint_file(name))
+
+            # En streaming las ventas ya están en las tablas principales (meta guarda cuántas)
+            if not meta.get('streamed'):
+                new_metrics = self.daily_metrics_buffer[meta['metrics_rows']:]
+                if new_metrics: append_csv(pd.DataFrame(new_metrics), self._checkpoint_file('daily_metrics.csv'))
+                if sales_rows: append_csv(pd.DataFrame(sales_rows), self._checkpoint_file('sales_history.csv'))
+                meta['metrics_rows'] = len(self.daily_metrics_buffer)
+                meta['sales_rows'] += len(sales_rows or [])
+        else:
+            # Run terminado: el estado vive en los ficheros principales, solo queda el marcador
+            for name in ['inventory_state.csv', 'clients_state.csv', 'daily_metrics.csv', 'sales_history.csv']:
+                self._checkpoint_file(name).unlink(missing_ok=True)
+
+        meta['rng_state'] = self.rng.bit_generator.state
+        tmp = self._checkpoint_file('state.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp, self._checkpoint_file('state.json'))
+
+    def _restore_checkpoint(self, meta):
+        """Recarga el estado de un run interrumpido y devuelve las ventas ya generadas."""
+        self.clients = pd.read_csv(self._checkpoint_file('clients_state.csv'))
+        self._reset_inventory(pd.read_csv(self._checkpoint_file('inventory_state.csv')))
+        self.rng.bit_generator.state = meta['rng_state']
+        if meta.get('streamed'): return pd.DataFrame()
+
+        metrics_path = self._checkpoint_file('daily_metrics.csv')
+        df_metrics = pd.read_csv(metrics_path, parse_dates=['Fecha']).head(meta['metrics_rows']) if metrics_path.exists() else pd.DataFrame()
+        self.daily_metrics_buffer = df_metrics.to_dict('records')
+
+        sales_path = self._checkpoint_file('sales_history.csv')
+        return pd.read_csv(sales_path, parse_dates=['Fecha']).head(meta['sales_rows']) if sales_path.exists() else pd.DataFrame()
+
+    def _simulate_day(self, current_date, e_idx, traffic, budgets):
+        """
+        Motor vectorizado de un día: puntúa todos los pares visitante×producto
+        de golpe y resuelve conflictos (mismo bolso / mismo cliente) por rondas.
+        Devuelve la lista de ventas del día, el revenue neto y los visitantes
+        que se encontraron sin stock.
+        """
+        prof = self.profiler
+        active_idx = np.flatnonzero(budgets > 800)
+        if len(active_idx) == 0: return [], 0, 0
+
+        with prof.phase('sampling'):
+            visitors = active_idx[self.rng.integers(0, len(active_idx), size=min(traffic, len(active_idx)))]
+
+            # Orden estable (por fila) para que un run reanudado desde checkpoint sea idéntico
+            stock_idx = np.sort(self.inventory.available())
+        prices = self.inventory.price
+        brand_names = self.inventory.brand_names
+        is_tier_1_brand = np.isin(brand_names, self.TIER_1_BRANDS)
+        prof.count('visitors', len(visitors))
+
+        sold_rows = []
+        pending = visitors
+        while len(pending) and len(stock_idx):
+            prof.count('rounds')
+            prof.count('scored_pairs', len(pending))
+            with prof.phase('sampling'):
+                # Cada visitante pendiente mira un bolso al azar del stock disponible
+                picks = stock_idx[self.rng.integers(0, len(stock_idx), size=len(pending))]
+            with prof.phase('scoring'):
+                p_code = self.inventory.brand_code(picks)
+                brand_match = self.brand_affinity[pending, p_code]
+                is_tier_1 = is_tier_1_brand[p_code]
+                score = self._calculate_affinity(budgets[pending], prices[picks], is_tier_1, brand_match, e_idx)
+                wants = score > 52
+
+            with prof.phase('resolve'):
+                # Conflictos: un bolso solo se vende una vez y un cliente compra una vez por ronda
+                cand = np.flatnonzero(wants)
+                _, first_item = np.unique(picks[cand], return_index=True)
+                cand = cand[np.sort(first_item)]
+                _, first_client = np.unique(pending[cand], return_index=True)
+                winners = cand[np.sort(first_client)]
+
+                sold_rows.append(picks[winners])
+                np.subtract.at(budgets, pending[winners], prices[picks[winners]])
+
+                # Los que perdieron un conflicto vuelven a mirar el stock restante
+                lost = np.setdiff1d(cand, winners, assume_unique=True)
+                pending = pending[np.sort(lost)]
+                stock_idx = np.setdiff1d(stock_idx, picks[winners], assume_unique=True)
+
+        stockouts = len(pending) if len(stock_idx) == 0 else 0
+        prof.count('stockouts', stockouts)
+        sold = np.concatenate(sold_rows) if sold_rows else np.array([], dtype=int)
+        if len(sold) == 0: return [], 0, stockouts
 
-        sales_log = []
-        for i in range(days):
+        with prof.phase('sell'):
+            rev = prices[sold]
+            is_return = self.rng.random(len(sold)) < 0.06
+            net = np.where(is_return, -rev, rev)
+            sold_brands = brand_names[self.inventory.brand_code(sold)]
+
+            # Escritura de estado una sola vez por día
+            self.inventory.sell(sold)
+
+            sales = [{
+                'Fecha': current_date,
+                'Marca': b,
+                'Net_Revenue': n,
+                'Status': 'Returned' if r else 'Completed',
+                'Cluster': 'High_End' if b in self.TIER_1_BRANDS else 'Standard'
+            } for b, n, r in zip(sold_brands, net.tolist(), is_return)]
+        prof.count('sales', len(sales))
+        return sales, float(net.sum()), stockouts
+
+    def _iter_days(self, start_date, first_day, last_day, econ, hype):
+        """
+        Bucle diario del simulador (días [first_day, last_day) desde start_date).
+        Es un generador: produce (día, ventas del día, métricas del día) y no acumula nada.
+        """
+        traffic_mean = self.traffic_mean
+        prof = self.profiler
+
+        # Arrays de trabajo: se leen una vez y se vuelcan al DataFrame por día
+        budgets = self.clients['Current_Budget'].to_numpy(dtype=float).copy() if not self.clients.empty else np.array([])
+
+        for i in range(first_day, last_day):
             current_date = start_date + timedelta(days=i)
-            row_macro = macro_df.iloc[i] if macro_df is not None else {'Economic_Index':1, 'Luxury_Hype':1}
-            e_idx, h_idx = row_macro['Economic_Index'], row_macro['Luxury_Hype']
-
-            # Reposición diaria
-            self._restock_inventory(current_date, volume=random.randint(8, 18))
-            self.live_inventory.loc[self.live_inventory['Status'] == 'Available', 'Days_On_Market'] += 1
-            
-            # --- TRÁFICO CONTROLADO ---
-            traffic = int(np.random.normal(traffic_mean, 4) * h_idx)
-            traffic = max(int(traffic_mean * 0.8), min(int(traffic_mean * 1.2), traffic))
-            
-            active_clients = self.clients[self.clients['Current_Budget'] > 800]
-            if not active_clients.empty:
-                visitors = active_clients.sample(n=min(traffic, len(active_clients)), replace=True)
-                stock = self.live_inventory[self.live_inventory['Status'] == 'Available']
-                
-                daily_revenue = 0
-                for _, client in visitors.iterrows():
-                    if stock.empty: break
-                    prod = stock.sample(n=1).iloc[0]
-                    
-                    if self._calculate_affinity(client, prod, e_idx) > 52:
-                        is_return = random.random() < 0.06
-                        rev = prod['Current_Price']
-                        
-                        sale_entry = {
-                            'Fecha': current_date, 
-                            'Marca': prod['Marca'], 
-                            'Net_Revenue': -rev if is_return else rev,
-                            'Status': 'Returned' if is_return else 'Completed',
-                            'Cluster': 'High_End' if prod['Marca'] in self.TIER_1_BRANDS else 'Standard'
-                        }
-                        sales_log.append(sale_entry)
-                        daily_revenue += sale_entry['Net_Revenue']
-                        
-                        # Actualizar
-                        self.live_inventory.loc[prod.name, 'Status'] = 'Sold'
-                        self.clients.loc[client.name, 'Current_Budget'] -= rev
-                        stock = self.live_inventory[self.live_inventory['Status'] == 'Available']
-
-            self.daily_metrics_buffer.append({
-                'Fecha': current_date, 'Revenue': daily_revenue, 'Traffic': traffic
-            })
-
-        self._save_state()
-        return pd.DataFrame(sales_log)
\ No newline at end of file
+            e_idx, h_idx = econ[i], hype[i]
+
+            with prof.phase('day'):
+                # Reposición diaria
+                with prof.phase('restock'):
+                    self._restock_inventory(current_date, volume=max(1, round(int(self.rng.integers(8, 19)) * self.restock_scale)))
+                with prof.phase('aging'):
+                    self.inventory.age()
+
+                # --- TRÁFICO CONTROLADO ---
+                with prof.phase('traffic'):
+                    traffic = int(self.rng.normal(traffic_mean, 4) * h_idx)
+                    traffic = max(int(traffic_mean * 0.8), min(int(traffic_mean * 1.2), traffic))
+
+                day_sales, daily_revenue, stockouts = self._simulate_day(current_date, e_idx, traffic, budgets)
+                if day_sales:
+                    self.clients['Current_Budget'] = budgets
+
+            day_metrics = {
+                'Fecha': current_date, 'Revenue': daily_revenue, 'Traffic': traffic,
+                'Stockouts': stockouts, 'Depleted_Clients': int((budgets <= 800).sum())
+            }
+            # Desglose de tiempos del día (solo con el profiler encendido)
+            if prof.enabled: day_metrics.update(prof.end_day())
+            yield i, day_sales, day_metrics
+
+    def _run_days(self, start_date, first_day, last_day, econ, hype, meta=None, checkpoint_every=None):
+        """Simulación en memoria: acumula ventas y métricas y devuelve las ventas como DataFrame."""
+        sales_log, checkpointed = [], 0
+        for i, day_sales, day_metrics in self._iter_days(start_date, first_day, last_day, econ, hype):
+            sales_log.extend(day_sales)
+            self.daily_metrics_buffer.append(day_metrics)
+
+            if checkpoint_every and (i + 1) % checkpoint_every == 0 and i + 1 < last_day:
+                meta.update(days_done=i + 1, last_date=day_metrics['Fecha'].isoformat())
+                with self.profiler.phase('checkpoint'):
+                    self._write_checkpoint(meta, sales_log[checkpointed:])
+                checkpointed = len(sales_log)
+
+        return pd.DataFrame(sales_log)
+
+    def _prepare_run(self, days, macro_df, persist, verbose, checkpoint_every, resume, streamed=False):
+        """Arranque común de un run: trayectoria macro, checkpoint a reanudar o estado inicial."""
+        if verbose: print(f"💼 Ejecutando Simulador V25 (Tráfico ~{self.traffic_mean}/día)...")
+
+        econ = macro_df['Economic_Index'].to_numpy(dtype=float) if macro_df is not None else np.ones(days)
+        hype = macro_df['Luxury_Hype'].to_numpy(dtype=float) if macro_df is not None else np.ones(days)
+
+        meta = self._read_checkpoint() if resume else None
+        if (meta is not None and not meta['complete'] and meta['days_total'] == days
+                and meta.get('streamed', False) == streamed):
+            prior_sales = self._restore_checkpoint(meta)
+            start_date = datetime.fromisoformat(meta['start_date'])
+            first_day = meta['days_done']
+            if verbose: print(f"   ↪️ Reanudando desde el día {first_day}/{days} ({meta['last_date'][:10]})")
+        else:
+            start_date = datetime.today() - timedelta(days=days)
+            first_day, prior_sales = 0, pd.DataFrame()
+            meta = {'start_date': start_date.isoformat(), 'days_total': days, 'days_done': 0,
+                    'last_date': None, 'sales_rows': 0, 'metrics_rows': 0, 'complete': False, 'streamed': streamed}
+            if persist and checkpoint_every:
+                for name in ['daily_metrics.csv', 'sales_history.csv']:
+                    self._checkpoint_file(name).unlink(missing_ok=True)
+            if len(self.inventory) == 0: self._restock_inventory(start_date, volume=350)
+        return start_date, first_day, prior_sales, meta, econ, hype
+
+    def generate_sales_data(self, days=365, macro_df=None, persist=True, verbose=True, checkpoint_every=None, resume=False):
+        """
+        persist: si es False no se escribe el estado a disco (réplicas Monte Carlo).
+        checkpoint_every: cada cuántos días se guarda un checkpoint recuperable.
+        resume: continúa un run interrumpido con la misma duración desde su último checkpoint.
+        """
+        start_date, first_day, prior_sales, meta, econ, hype = self._prepare_run(days, macro_df, persist, verbose, checkpoint_every, resume)
+
+        df_new = self._run_days(start_date, first_day, days, econ, hype, meta, checkpoint_every if persist else None)
+        df_sales = pd.concat([prior_sales, df_new], ignore_index=True) if not prior_sales.empty else df_new
+
+        if persist:
+            self._save_state()
+            meta.update(days_done=days, last_date=(start_date + timedelta(days=days - 1)).isoformat(), complete=True)
+            self._write_checkpoint(meta)
+        return df_sales
+
+    def stream_sales_data(self, days=365, macro_df=None, sink=None, verbose=True, checkpoint_every=None, resume=False):
+        """
+        Variante en streaming de generate_sales_data para runs largos: ventas y
+        métricas se escriben por bloques en sales_history / daily_metrics (ver
+        SimulationSink) y cada bloque escrito se entrega al llamador:
+
+            for df_sales, df_metrics in loader.stream_sales_data(days=3650):
+                ...
+
+        La memoria queda acotada por el tamaño de bloque, no por la duración del run.
+        """
+        sink = sink or SimulationSink()
+        start_date, first_day, _, meta, econ, hype = self._prepare_run(days, macro_df, True, verbose, checkpoint_every, resume, streamed=True)
+        if first_day: sink.resume(meta['sales_rows'], meta['metrics_rows'])
+        else: sink.reset()
+        self.daily_metrics_buffer = []
+
+        for i, day_sales, day_metrics in self._iter_days(start_date, first_day, days, econ, hype):
+            sink.add(day_sales, day_metrics)
+            at_checkpoint = checkpoint_every and (i + 1) % checkpoint_every == 0 and i + 1 < days
+            if not (sink.full or at_checkpoint): continue
+
+            with self.profiler.phase('flush'):
+                chunk = sink.flush()
+            if at_checkpoint:
+                meta.update(days_done=i + 1, last_date=day_metrics['Fecha'].isoformat(),
+                            sales_rows=sink.sales_rows, metrics_rows=sink.metrics_rows)
+                with self.profiler.phase('checkpoint'):
+                    self._write_checkpoint(meta)
+            yield chunk
+
+        with self.profiler.phase('flush'):
+            chunk = sink.flush()
+        self._save_state(write_metrics=False)
+        meta.update(days_done=days, last_date=(start_date + timedelta(days=days - 1)).isoformat(),
+                    sales_rows=sink.sales_rows, metrics_rows=sink.metrics_rows, complete=True)
+        self._write_checkpoint(meta)
+        yield chunk
+
+    def extend(self, days=30, macro_df=None):
+        """
+        Prolonga el histórico N días desde la última fecha simulada, con el RNG
+        del último checkpoint. Solo añade filas nuevas a sales_history y daily_metrics.
+        """
+        meta = self._read_checkpoint()
+        if meta is not None and not meta['complete']:
+            print("⚠️ Hay un run interrumpido: reanúdalo con generate_sales_data(resume=True) antes de extender.")
+            return pd.DataFrame()
+
+        if meta is not None:
+            self.rng.bit_generator.state = meta['rng_state']
+            last_date = datetime.fromisoformat(meta['last_date'])
+        elif table_exists("daily_metrics"):
+            last_date = read_table("daily_metrics", columns=['Fecha'])['Fecha'].max().to_pydatetime()
+        else:
+            print("⚠️ No hay histórico previo que extender.")
+            return pd.DataFrame()
+
+        start_date = last_date + timedelta(days=1)
+        if macro_df is None:
+            # La macro del tramo nuevo también se añade a macro_indicators (alineada con las fechas simuladas)
+            macro_df = generate_macro_context(days=days, rng=self.rng)
+            macro_df['Fecha'] = [start_date + timedelta(days=i) for i in range(days)]
+            append_table("macro_indicators", macro_df)
+        econ = macro_df['Economic_Index'].to_numpy(dtype=float)
+        hype = macro_df['Luxury_Hype'].to_numpy(dtype=float)
+
+        print(f"💼 Extendiendo simulación {days} días desde {last_date:%Y-%m-%d}...")
+        if len(self.inventory) == 0: self._restock_inventory(start_date, volume=350)
+        self.daily_metrics_buffer = []
+        df_new = self._run_days(start_date, 0, days, econ, hype)
+
+        # Append-only: no se reescribe el histórico existente
+        append_table("sales_history", df_new)
+        append_table("daily_metrics", pd.DataFrame(self.daily_metrics_buffer))
+        self._save_state(write_metrics=False)
+
+        meta = meta or {'start_date': start_date.isoformat(), 'days_done': 0, 'days_total': 0, 'sales_rows': 0, 'metrics_rows': 0}
+        meta.update(days_total=meta['days_total'] + days, days_done=meta['days_done'] + days,
+                    last_date=(start_date + timedelta(days=days - 1)).isoformat(), complete=True)
+        self._write_checkpoint(meta)
+        return df_new
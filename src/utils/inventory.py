@@ -0,0 +1,179 @@
+import pandas as pd
+import numpy as np
+
+# Códigos de estado compactos (uint8) y su etiqueta exportada
+STATUS_AVAILABLE = 0
+STATUS_SOLD = 1
+STATUS_TRANSFERRED = 2   # Enviado a otra tienda (simulación multi-tienda)
+STATUS_LABELS = np.array(['Available', 'Sold', 'Transferred'], dtype=object)
+
+# Columnas que gestiona el simulador (el resto viene de la plantilla de catálogo)
+RUNTIME_COLUMNS = ['ID_Serial_Unico', 'Date_Added', 'Days_On_Market', 'Status', 'Current_Price', 'COGS']
+
+
+class InventoryStore:
+    """
+    Inventario vivo en columnas NumPy preasignadas y ampliables.
+
+    - Cada fila guarda solo el índice de su plantilla de catálogo; las columnas
+      descriptivas (Marca, Modelo...) se reconstruyen al exportar.
+    - Se mantiene un índice denso de filas disponibles (swap-remove), así que
+      reponer y vender cuesta O(lote) y no O(histórico).
+    - La antigüedad se deriva de un contador global de días: envejecer es O(1).
+    """
+
+    def __init__(self, templates, template_prices, capacity=1024):
+        self.templates = templates.reset_index(drop=True) if templates is not None else pd.DataFrame()
+        self.template_prices = np.asarray(template_prices, dtype=float)
+        self._index_brands()
+
+        self.size = 0
+        self.tick = 0
+        self.n_available = 0
+        self._alloc(capacity)
+
+    # --- Gestión de memoria ---
+    def _alloc(self, capacity):
+        self.capacity = capacity
+        self.template = np.zeros(capacity, dtype=np.int32)
+        self.serial = np.zeros(capacity, dtype=np.int64)
+        self.added_date = np.full(capacity, np.datetime64('NaT'), dtype='datetime64[ns]')
+        self.added_tick = np.zeros(capacity, dtype=np.int32)
+        self.closed_tick = np.zeros(capacity, dtype=np.int32)
+        self.status = np.zeros(capacity, dtype=np.uint8)
+        self.price = np.zeros(capacity, dtype=float)
+        self.cogs = np.zeros(capacity, dtype=float)
+        # Índice de disponibles: avail[:n_available] son filas, pos[fila] su posición (-1 si no está)
+        self.avail = np.zeros(capacity, dtype=np.int64)
+        self.pos = np.full(capacity, -1, dtype=np.int64)
+
+    def _grow(self, needed):
+        if needed <= self.capacity: return
+        new_capacity = max(needed, self.capacity * 2)
+        for name in ['template', 'serial', 'added_date', 'added_tick', 'closed_tick', 'status', 'price', 'cogs', 'avail', 'pos']:
+            old = getattr(self, name)
+            new = np.empty(new_capacity, dtype=old.dtype)
+            new[:self.capacity] = old
+            setattr(self, name, new)
+        self.pos[self.capacity:] = -1
+        self.capacity = new_capacity
+
+    def _index_brands(self):
+        brands = self.templates['Marca'].astype(str) if 'Marca' in self.templates.columns else pd.Series([''] * len(self.templates))
+        codes, names = pd.factorize(brands)
+        self.template_brand = codes.astype(np.int32)
+        self.brand_names = np.asarray(names, dtype=object)
+
+    def __len__(self):
+        return self.size
+
+    # --- Operaciones O(lote) ---
+    def available(self):
+        """Vista de las filas disponibles (no modificar)."""
+        return self.avail[:self.n_available]
+
+    def brand_code(self, rows):
+        return self.template_brand[self.template[rows]]
+
+    def restock(self, template_idx, serials, date):
+        template_idx = np.asarray(template_idx, dtype=np.int32)
+        n = len(template_idx)
+        if n == 0: return np.array([], dtype=np.int64)
+        self._grow(self.size + n)
+
+        rows = np.arange(self.size, self.size + n)
+        self.template[rows] = template_idx
+        self.serial[rows] = serials
+        self.added_date[rows] = np.datetime64(pd.Timestamp(date))
+        self.added_tick[rows] = self.tick
+        self.status[rows] = STATUS_AVAILABLE
+        self.price[rows] = self.template_prices[template_idx]
+        self.cogs[rows] = self.price[rows] * 0.55
+        self.size += n
+
+        self.avail[self.n_available:self.n_available + n] = rows
+        self.pos[rows] = np.arange(self.n_available, self.n_available + n)
+        self.n_available += n
+        return rows
+
+    def sell(self, rows, status=STATUS_SOLD):
+        """Marca filas como vendidas (o transferidas) y las saca del índice de disponibles."""
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        rows = rows[self.pos[rows] >= 0]
+        k = len(rows)
+        if k == 0: return
+
+        self.status[rows] = status
+        self.closed_tick[rows] = self.tick
+
+        # Swap-remove en bloque: las filas de la cola que sobreviven tapan los huecos
+        tail_start = self.n_available - k
+        holes = self.pos[rows]
+        holes = np.sort(holes[holes < tail_start])
+        tail = self.avail[tail_start:self.n_available]
+        fillers = tail[~np.isin(tail, rows, assume_unique=True)]
+
+        self.avail[holes] = fillers
+        self.pos[fillers] = holes
+        self.pos[rows] = -1
+        self.n_available = tail_start
+
+    def age(self, days=1):
+        """Envejece todo el stock disponible: solo avanza el reloj."""
+        self.tick += days
+
+    # --- Import / Export ---
+    def days_on_market(self):
+        n = self.size
+        closed = np.where(self.status[:n] == STATUS_AVAILABLE, self.tick, self.closed_tick[:n])
+        return closed - self.added_tick[:n]
+
+    def to_frame(self):
+        """Materializa el inventario como DataFrame (solo para persistir / UI)."""
+        n = self.size
+        if n == 0: return pd.DataFrame()
+        df = self.templates.iloc[self.template[:n]].reset_index(drop=True)
+        df = df.drop(columns=[c for c in RUNTIME_COLUMNS if c in df.columns])
+        df['ID_Serial_Unico'] = [f"SN-{s}" for s in self.serial[:n]]
+        df['Date_Added'] = self.added_date[:n]
+        df['Days_On_Market'] = self.days_on_market()
+        df['Status'] = STATUS_LABELS[self.status[:n]]
+        df['Current_Price'] = self.price[:n]
+        df['COGS'] = self.cogs[:n]
+        return df
+
+    def load_frame(self, df):
+        """Carga un inventory_state.csv previo: cada fila pasa a ser su propia plantilla."""
+        if df is None or df.empty: return
+        n = len(df)
+        static = df.drop(columns=[c for c in RUNTIME_COLUMNS if c in df.columns]).reset_index(drop=True)
+
+        offset = len(self.templates)
+        self.templates = pd.concat([self.templates, static], ignore_index=True)
+        prices = pd.to_numeric(df.get('Current_Price', pd.Series(np.zeros(n))), errors='coerce').fillna(0).to_numpy(dtype=float)
+        self.template_prices = np.concatenate([self.template_prices, prices])
+        self._index_brands()
+
+        self._grow(self.size + n)
+        rows = np.arange(self.size, self.size + n)
+        self.template[rows] = np.arange(offset, offset + n)
+        serials = pd.to_numeric(df.get('ID_Serial_Unico', pd.Series([''] * n)).astype(str).str.replace(r'\D', '', regex=True), errors='coerce')
+        self.serial[rows] = serials.fillna(0).astype(np.int64).to_numpy()
+        self.added_date[rows] = pd.to_datetime(df.get('Date_Added', pd.Series([pd.NaT] * n)), errors='coerce').to_numpy(dtype='datetime64[ns]')
+        dom = pd.to_numeric(df.get('Days_On_Market', pd.Series(np.zeros(n))), errors='coerce').fillna(0).to_numpy(dtype=np.int32)
+        self.added_tick[rows] = self.tick - dom
+        self.closed_tick[rows] = self.tick
+        self.price[rows] = prices
+        cogs = pd.to_numeric(df['COGS'], errors='coerce').to_numpy(dtype=float) if 'COGS' in df.columns else prices * 0.55
+        self.cogs[rows] = np.where(np.isnan(cogs), prices * 0.55, cogs)
+
+        labels = df.get('Status', pd.Series(['Available'] * n)).reset_index(drop=True)
+        status = labels.map({label: code for code, label in enumerate(STATUS_LABELS)}).fillna(STATUS_SOLD).to_numpy(dtype=np.uint8)
+        is_available = status == STATUS_AVAILABLE
+        self.status[rows] = status
+        self.size += n
+
+        new_avail = rows[is_available]
+        self.avail[self.n_available:self.n_available + len(new_avail)] = new_avail
+        self.pos[new_avail] = np.arange(self.n_available, self.n_available + len(new_avail))
+        self.n_available += len(new_avail)
@@ -0,0 +1,133 @@
+import copy
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .config import settings, FILES
+from .data_loader import DataLoader
+from .scenarios import generate_macro_paths
+from .storage import write_table
+
+MC_METRICS = ['Revenue', 'Stockouts', 'Depleted_Clients']
+PERCENTILES = [10, 50, 90]
+
+# Estado base por proceso: se carga una vez y cada réplica trabaja sobre una copia
+_BASE_LOADER = None
+
+
+class PercentileStore:
+    """
+    Almacén agregado de métricas diarias por escenario y réplica.
+    Las réplicas se insertan según terminan (no se guarda su log de ventas) y
+    los percentiles se calculan al final sobre el eje de réplicas.
+    """
+
+    def __init__(self, scenarios, n_replicas, days, metrics=MC_METRICS):
+        self.scenarios = list(scenarios)
+        self.metrics = list(metrics)
+        self.days = days
+        self.values = np.full((len(self.scenarios), n_replicas, days, len(self.metrics)), np.nan)
+
+    def add(self, scenario_idx, replica_idx, daily_values):
+        self.values[scenario_idx, replica_idx] = daily_values
+
+    def summary(self, percentiles=PERCENTILES):
+        """Percentiles diarios por escenario (formato ancho: Revenue_P10, Revenue_P50...)."""
+        start = (datetime.today() - timedelta(days=self.days)).date()
+        dates = pd.date_range(start=start, periods=self.days)
+        q = np.nanpercentile(self.values, percentiles, axis=1)  # (p, escenario, día, métrica)
+
+        frames = []
+        for s_idx, (trend_bias, hype_bias) in enumerate(self.scenarios):
+            df = pd.DataFrame({'Trend_Bias': trend_bias, 'Hype_Bias': hype_bias, 'Day': np.arange(self.days), 'Fecha': dates})
+            for m_idx, metric in enumerate(self.metrics):
+                for p_idx, p in enumerate(percentiles):
+                    df[f"{metric}_P{p}"] = q[p_idx, s_idx, :, m_idx]
+            frames.append(df)
+        return pd.concat(frames, ignore_index=True)
+
+    def totals(self, percentiles=PERCENTILES):
+        """Percentiles del horizonte completo: revenue y roturas acumuladas, clientes agotados al cierre."""
+        revenue = np.nansum(self.values[..., self.metrics.index('Revenue')], axis=2)
+        stockouts = np.nansum(self.values[..., self.metrics.index('Stockouts')], axis=2)
+        depleted = self.values[:, :, -1, self.metrics.index('Depleted_Clients')]
+
+        rows = []
+        for s_idx, (trend_bias, hype_bias) in enumerate(self.scenarios):
+            row = {'Trend_Bias': trend_bias, 'Hype_Bias': hype_bias}
+            for name, arr in [('Total_Revenue', revenue), ('Total_Stockouts', stockouts), ('Depleted_Clients', depleted)]:
+                for p, val in zip(percentiles, np.nanpercentile(arr[s_idx], percentiles)):
+                    row[f"{name}_P{p}"] = val
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def _init_worker(base_seq):
+    global _BASE_LOADER
+    # La carga base también se siembra: todos los procesos parten del mismo estado
+    _BASE_LOADER = DataLoader(seed=base_seq)
+
+
+def _run_replica(task):
+    scenario_idx, replica_idx, econ, hype, seed_seq = task
+
+    loader = copy.deepcopy(_BASE_LOADER)
+    loader.rng = np.random.default_rng(seed_seq)
+    macro_df = pd.DataFrame({'Economic_Index': econ, 'Luxury_Hype': hype})
+    loader.generate_sales_data(days=len(econ), macro_df=macro_df, persist=False, verbose=False)
+
+    daily = pd.DataFrame(loader.daily_metrics_buffer)[MC_METRICS].to_numpy(dtype=float)
+    return scenario_idx, replica_idx, daily
+
+
+def replica_seeds(root, n_scenarios, n_replicas):
+    """Flujos independientes por (escenario, réplica) derivados de una única SeedSequence raíz."""
+    return [scenario.spawn(n_replicas) for scenario in root.spawn(n_scenarios)]
+
+
+def run_monte_carlo(n_replicas=100, trend_grid=(1.0,), hype_grid=(1.0,), days=None, workers=None, seed=None, output_path=None):
+    """
+    Lanza n_replicas por cada combinación trend_bias × hype_bias en un pool de procesos.
+    Devuelve (resumen diario, totales) y guarda el resumen diario en FILES['monte_carlo'].
+    seed: semilla raíz (None = aleatoria; se imprime para poder repetir la ejecución).
+    """
+    days = days or settings["simulation_days"]
+    workers = workers or os.cpu_count()
+    scenarios = list(itertools.product(trend_grid, hype_grid))
+    root = np.random.SeedSequence(seed)
+    base_seq, replicas_seq, macro_seq = root.spawn(3)
+    seeds = replica_seeds(replicas_seq, len(scenarios), n_replicas)
+
+    # Todas las trayectorias macro en una sola llamada (n_escenarios × n_réplicas, días)
+    trend, hype = np.repeat(np.array(scenarios, dtype=float), n_replicas, axis=0).T
+    econ_paths, hype_paths = generate_macro_paths(len(scenarios) * n_replicas, days, trend, hype,
+                                                  rng=np.random.default_rng(macro_seq))
+
+    tasks = [(s_idx, r_idx, econ_paths[s_idx * n_replicas + r_idx], hype_paths[s_idx * n_replicas + r_idx], seeds[s_idx][r_idx])
+             for s_idx in range(len(scenarios))
+             for r_idx in range(n_replicas)]
+
+    print(f"🎲 Monte Carlo: {len(scenarios)} escenarios × {n_replicas} réplicas ({days} días, {workers} procesos, semilla {root.entropy})...")
+    store = PercentileStore(scenarios, n_replicas, days)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(base_seq,)) as pool:
+        futures = [pool.submit(_run_replica, task) for task in tasks]
+        for done, future in enumerate(as_completed(futures), start=1):
+            s_idx, r_idx, daily = future.result()
+            store.add(s_idx, r_idx, daily)
+            if done % max(1, len(tasks) // 10) == 0:
+                print(f"   -> {done}/{len(tasks)} réplicas completadas")
+
+    df_summary = store.summary()
+    df_totals = store.totals()
+
+    if output_path:
+        df_summary.to_csv(output_path, index=False)
+    else:
+        write_table("monte_carlo", df_summary)
+    print(f"   💾 Percentiles diarios guardados en: {output_path or FILES['monte_carlo']}")
+    return df_summary, df_totals
@@ -0,0 +1,117 @@
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+import pandas as pd
+
+# Fases del bucle diario que se vuelcan siempre en daily_metrics (columnas T_<fase>_ms)
+DAY_PHASES = ['day', 'restock', 'aging', 'traffic', 'sampling', 'scoring', 'resolve', 'sell']
+
+# Contexto vacío compartido: con el profiler apagado cada fase cuesta una llamada y un `with`
+_NULL = nullcontext()
+
+
+class SimProfiler:
+    """
+    Instrumentación del simulador: temporizadores por fase (anidables),
+    contadores y, opcionalmente, memoria asignada por fase (tracemalloc).
+
+        with profiler.phase('scoring'):
+            ...
+        profiler.count('visitors', n)
+
+    Apagado (por defecto) no mide nada. Encendido guarda, por pila de fases,
+    llamadas, tiempo inclusivo y propio, lo que permite exportar una traza
+    en formato "folded" (flamegraph.pl, speedscope) y una tabla resumen.
+    """
+
+    def __init__(self, enabled=False, track_allocations=False):
+        self.enabled = enabled
+        self.track_allocations = enabled and track_allocations
+        self.reset()
+        if self.track_allocations and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def reset(self):
+        self._stack = []
+        self.calls = defaultdict(int)
+        self.inclusive = defaultdict(float)
+        self.exclusive = defaultdict(float)
+        self.allocated = defaultdict(int)
+        self.counters = defaultdict(int)
+        self._day = defaultdict(float)
+
+    # --- Medición ---
+    def phase(self, name):
+        return self._phase(name) if self.enabled else _NULL
+
+    @contextmanager
+    def _phase(self, name):
+        frame = [name, 0.0]
+        self._stack.append(frame)
+        key = ';'.join(f[0] for f in self._stack)
+        mem0 = tracemalloc.get_traced_memory()[0] if self.track_allocations else 0
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - t0
+            self._stack.pop()
+            if self._stack: self._stack[-1][1] += elapsed
+            self.calls[key] += 1
+            self.inclusive[key] += elapsed
+            self.exclusive[key] += elapsed - frame[1]
+            self._day[name] += elapsed
+            if self.track_allocations:
+                self.allocated[key] += tracemalloc.get_traced_memory()[0] - mem0
+
+    def count(self, name, n=1):
+        if self.enabled: self.counters[name] += n
+
+    def end_day(self):
+        """Desglose del día en ms (columnas fijas para que el esquema de daily_metrics no cambie)."""
+        row = {f"T_{name}_ms": self._day.get(name, 0.0) * 1000 for name in DAY_PHASES}
+        self._day.clear()
+        return row
+
+    # --- Resultados ---
+    def summary(self):
+        """Tabla por pila de fases, ordenada por tiempo inclusivo."""
+        if not self.calls: return pd.DataFrame()
+        total = sum(t for key, t in self.inclusive.items() if ';' not in key) or 1.0
+        df = pd.DataFrame({
+            'Fase': list(self.calls),
+            'Llamadas': [self.calls[k] for k in self.calls],
+            'Total_s': [self.inclusive[k] for k in self.calls],
+            'Propio_s': [self.exclusive[k] for k in self.calls],
+        })
+        df['Media_ms'] = df['Total_s'] / df['Llamadas'] * 1000
+        df['Pct'] = df['Total_s'] / total * 100
+        if self.track_allocations:
+            df['Alloc_KB'] = [self.allocated[k] / 1024 for k in self.calls]
+        return df.sort_values('Total_s', ascending=False).reset_index(drop=True)
+
+    def write_folded(self, path):
+        """Traza 'pila;de;fases microsegundos' (tiempo propio), compatible con flamegraph.pl / speedscope."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for key, seconds in self.exclusive.items():
+                f.write(f"{key} {max(int(seconds * 1e6), 0)}\n")
+        return path
+
+    def report(self, trace_path=None):
+        df = self.summary()
+        if df.empty: return df
+        print("\n⏱️ PERFIL DEL SIMULADOR")
+        print(df.to_string(index=False, float_format="{:,.3f}".format))
+        if self.counters:
+            print("   " + " · ".join(f"{k}: {v:,}" for k, v in sorted(self.counters.items())))
+        if self.track_allocations:
+            _, peak = tracemalloc.get_traced_memory()
+            print(f"   🧠 Pico de memoria trazada: {peak / 1024 ** 2:,.1f} MB")
+        if trace_path:
+            print(f"   🔥 Traza flame graph: {self.write_folded(trace_path)}")
+        return df
@@ -2,30 +2,91 @@ import pandas as pd
 import numpy as np
 from datetime import datetime
 
-def generate_macro_context(days=730, trend_bias=1.0, hype_bias=1.0):
+# scipy (dependencia de scikit-learn) resuelve la recurrencia con un filtro IIR compilado
+try:
+    from scipy.signal import lfilter
+    HAS_SCIPY = True
+except ImportError:
+    HAS_SCIPY = False
+
+HYPE_REVERSION = 0.03      # Fuerza de reversión a la media del hype
+HYPE_BOUNDS = (0.6, 1.8)
+_SCAN_BLOCK = 256          # Bloques del fallback sin scipy (a^-256 no desborda)
+
+
+def _mean_reverting(shocks, kappa=HYPE_REVERSION):
     """
-    trend_bias: < 1.0 para forzar crisis, > 1.0 para forzar boom.
-    hype_bias: multiplicador de volatilidad/viralidad.
+    Resuelve h_t = h_{t-1} + s_t + kappa·(1 - h_{t-1} - s_t) para todas las filas a la vez.
+    Sobre la desviación g = h - 1 es lineal: g_t = a·(g_{t-1} + s_t), con a = 1 - kappa y g_{-1} = 0.
+    """
+    a = 1.0 - kappa
+    if HAS_SCIPY:
+        return lfilter([a], [1.0, -a], shocks, axis=-1)
+
+    # Sin scipy: forma cerrada por bloques, g_j = a^(j+1)·(carry + Σ_{i<=j} a^-i·s_i)
+    g = np.empty_like(shocks)
+    carry = np.zeros(shocks.shape[0])
+    for start in range(0, shocks.shape[1], _SCAN_BLOCK):
+        block = shocks[:, start:start + _SCAN_BLOCK]
+        k = np.arange(block.shape[1])
+        g[:, start:start + block.shape[1]] = a ** (k + 1) * (carry[:, None] + np.cumsum(block * a ** -k, axis=1))
+        carry = g[:, start + block.shape[1] - 1]
+    return g
+
+
+def generate_macro_paths(n_scenarios=1, days=730, trend_bias=1.0, hype_bias=1.0, rng=None):
     """
-    dates = pd.date_range(end=datetime.today(), periods=days)
-    
+    Genera n_scenarios trayectorias macro de golpe.
+    trend_bias / hype_bias: escalar o un valor por escenario.
+    Devuelve (economic_index, luxury_hype), dos arrays (n_scenarios, days).
+    """
+    rng = np.random.default_rng(rng)
+    trend_bias = np.asarray(trend_bias, dtype=float).reshape(-1, 1)
+    hype_bias = np.asarray(hype_bias, dtype=float).reshape(-1, 1)
+
     # Ciclo Económico con Sesgo del Usuario
     x = np.arange(days)
     cycle = (1.0 + 0.15 * np.sin(2 * np.pi * x / (365*3))) * trend_bias
-    noise = np.random.normal(0, 0.02, days)
-    economic_index = cycle + noise
-    
-    # Hype con Sesgo del Usuario
-    hype_series = []
-    h_val = 1.0
-    for _ in range(days):
-        h_val += np.random.normal(0, 0.05 * hype_bias)
-        h_val += (1.0 - h_val) * 0.03 # Reversión a la media
-        hype_series.append(max(0.6, min(1.8, h_val)))
-        
+    economic_index = cycle + rng.normal(0, 0.02, (n_scenarios, days))
+
+    # Hype con Sesgo del Usuario: paseo con reversión a la media, acotado solo a la salida
+    shocks = rng.normal(0, 0.05 * hype_bias, (n_scenarios, days))
+    luxury_hype = np.clip(1.0 + _mean_reverting(shocks), *HYPE_BOUNDS)
+    return economic_index, luxury_hype
+
+
+def paths_to_frame(economic_index, luxury_hype, end=None):
+    """Formato largo (Escenario, Fecha, Economic_Index, Luxury_Hype) para el simulador o la UI."""
+    n_scenarios, days = economic_index.shape
+    dates = pd.date_range(end=end or datetime.today(), periods=days)
+    return pd.DataFrame({
+        'Escenario': np.repeat(np.arange(n_scenarios), days),
+        'Fecha': np.tile(dates, n_scenarios),
+        'Economic_Index': economic_index.ravel(),
+        'Luxury_Hype': luxury_hype.ravel()
+    })
+
+
+def path_bands(economic_index, luxury_hype, percentiles=(10, 50, 90), end=None):
+    """Bandas diarias (P10/P50/P90...) sobre miles de trayectorias: lo que consume un fan chart."""
+    days = economic_index.shape[1]
+    df = pd.DataFrame({'Fecha': pd.date_range(end=end or datetime.today(), periods=days)})
+    for name, paths in [('Economic_Index', economic_index), ('Luxury_Hype', luxury_hype)]:
+        for p, band in zip(percentiles, np.percentile(paths, percentiles, axis=0)):
+            df[f"{name}_P{p}"] = band
+    return df
+
+
+def generate_macro_context(days=730, trend_bias=1.0, hype_bias=1.0, rng=None):
+    """
+    trend_bias: < 1.0 para forzar crisis, > 1.0 para forzar boom.
+    hype_bias: multiplicador de volatilidad/viralidad.
+    rng: numpy.random.Generator o semilla (None = entropía del sistema).
+    """
+    economic_index, luxury_hype = generate_macro_paths(1, days, trend_bias, hype_bias, rng)
     df = pd.DataFrame({
-        'Fecha': dates,
-        'Economic_Index': economic_index,
-        'Luxury_Hype': hype_series
+        'Fecha': pd.date_range(end=datetime.today(), periods=days),
+        'Economic_Index': economic_index[0],
+        'Luxury_Hype': luxury_hype[0]
     })
-    return df
\ No newline at end of file
+    return df
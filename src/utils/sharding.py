@@ -0,0 +1,265 @@
+import os
+import time
+import multiprocessing as mp
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from .config import settings, FILES
+from .data_loader import DataLoader
+from .inventory import STATUS_TRANSFERRED
+from .scenarios import generate_macro_context
+from .storage import write_table
+from .streaming import SimulationSink
+
+ONLINE_SHARD = "Online"
+OPENING_STOCK = 350
+SHARD_METRICS = ['Revenue', 'Traffic', 'Stockouts']
+
+
+def build_shards(clients, online_channels=None):
+    """
+    Reparto de clientes por tienda: cada cliente pertenece a la boutique de su
+    ciudad y, si compra por canales digitales, también al shard Online con el
+    mismo monedero (se concilia en cada paso de reconciliación).
+    Devuelve {tienda: filas de clientes}.
+    """
+    online_channels = settings.get("online_channels", []) if online_channels is None else online_channels
+    if 'City' in clients.columns:
+        cities = clients['City'].fillna('Sin_Ciudad').astype(str).to_numpy()
+    else:
+        cities = np.full(len(clients), 'Boutique', dtype=object)
+
+    shards = {city: np.flatnonzero(cities == city) for city in sorted(set(cities))}
+    if 'Preferred_Channel' in clients.columns:
+        online = np.flatnonzero(clients['Preferred_Channel'].isin(online_channels).to_numpy())
+        if len(online): shards[ONLINE_SHARD] = online
+    return shards
+
+
+def assign_workers(weights, workers):
+    """Reparte tiendas entre procesos equilibrando la carga (mayor primero al proceso más libre)."""
+    bins = [[] for _ in range(workers)]
+    load = np.zeros(workers)
+    for name in sorted(weights, key=weights.get, reverse=True):
+        target = int(np.argmin(load))
+        bins[target].append(name)
+        load[target] += weights[name]
+    return [b for b in bins if b]
+
+
+def plan_transfers(available, weights, threshold=0.5, in_transit=None):
+    """
+    Traspasos entre tiendas: las que bajan de threshold × su stock objetivo
+    (proporcional a su peso) reciben unidades de las que van sobradas.
+    in_transit ({tienda: unidades}) son envíos que aún no han llegado: cuentan
+    como stock del destino (no se vuelven a pedir) pero no se pueden reenviar.
+    Devuelve [(origen, destino, unidades)].
+    """
+    in_transit = in_transit or {}
+    names = list(available)
+    on_hand = np.array([available[n] for n in names], dtype=float)
+    stock = on_hand + np.array([in_transit.get(n, 0) for n in names], dtype=float)
+    target = stock.sum() * np.array([weights[n] for n in names])
+    need = np.where(stock < threshold * target, np.ceil(target - stock), 0)
+    spare = np.minimum(np.maximum(np.floor(stock - target), 0), on_hand)
+
+    moves = []
+    for dst in np.argsort(-need, kind="stable"):
+        for src in np.argsort(-spare, kind="stable"):
+            if need[dst] <= 0: break
+            if spare[src] <= 0 or src == dst: continue
+            units = int(min(need[dst], spare[src]))
+            moves.append((names[src], names[dst], units))
+            need[dst] -= units
+            spare[src] -= units
+    return moves
+
+
+def _ship(shard, units):
+    """Saca unidades al azar del stock de una tienda y devuelve (plantillas, seriales) para el destino."""
+    stock = np.sort(shard.inventory.available())
+    rows = shard.rng.choice(stock, size=min(units, len(stock)), replace=False)
+    payload = (shard.inventory.template[rows].copy(), shard.inventory.serial[rows].copy())
+    shard.inventory.sell(rows, status=STATUS_TRANSFERRED)
+    return payload
+
+
+def _receive(shard, payloads, date):
+    """Da de alta en el stock de una tienda los traspasos que le llegan."""
+    for template_idx, serials in payloads:
+        shard.inventory.restock(template_idx, serials, date)
+
+
+def _run_shard_epoch(name, shard, first_day, last_day, econ, hype, start_date, order):
+    """Un bloque de días de una tienda: aplica la conciliación recibida, envía traspasos y simula."""
+    t0 = time.perf_counter()
+    if 'budgets' in order:
+        rows, values = order['budgets']
+        budgets = shard.clients['Current_Budget'].to_numpy(dtype=float).copy()
+        budgets[rows] = values
+        shard.clients['Current_Budget'] = budgets
+    _receive(shard, order.get('receive', []), start_date + timedelta(days=first_day))
+    shipments = [(dst, _ship(shard, units)) for dst, units in order.get('ship', [])]
+
+    sales, metrics = [], []
+    for _, day_sales, day_metrics in shard._iter_days(start_date, first_day, last_day, econ, hype):
+        for sale in day_sales: sale['Tienda'] = name
+        sales.append(day_sales)
+        metrics.append(day_metrics)
+
+    return {'sales': sales, 'metrics': metrics, 'shipments': shipments,
+            'available': shard.inventory.n_available,
+            'budgets': shard.clients['Current_Budget'].to_numpy(dtype=float),
+            'seconds': time.perf_counter() - t0}
+
+
+def _shard_worker(conn, shards, econ, hype, start_date):
+    """Proceso persistente: mantiene sus tiendas en memoria y simula bloques de días bajo demanda."""
+    while True:
+        msg = conn.recv()
+        if msg is None: break
+        if msg[0] == 'state':
+            # Los traspasos enviados en el último bloque llegan antes de volcar el inventario
+            _, last_day, orders = msg
+            for name, shard in shards.items():
+                _receive(shard, orders.get(name, {}).get('receive', []), start_date + timedelta(days=last_day))
+            conn.send({name: (shard.inventory.to_frame(), shard.clients['Current_Budget'].to_numpy(dtype=float))
+                       for name, shard in shards.items()})
+            continue
+        _, first_day, last_day, orders = msg
+        conn.send({name: _run_shard_epoch(name, shard, first_day, last_day, econ, hype, start_date, orders.get(name, {}))
+                   for name, shard in shards.items()})
+    conn.close()
+
+
+def run_sharded(days=None, macro_df=None, workers=None, reconcile_every=None, seed=None, sink=None):
+    """
+    Simulación multi-tienda: clientes repartidos por ciudad (+ canal Online) y un
+    inventario por tienda, cada grupo de tiendas en su propio proceso. Cada
+    reconcile_every días se concilian los monederos de los clientes compartidos
+    y se planifican traspasos de stock (llegan en el bloque siguiente).
+    Ventas (con columna Tienda) y métricas agregadas se vuelcan con SimulationSink.
+    Devuelve el throughput por tienda.
+    """
+    days = days or settings["simulation_days"]
+    workers = workers or os.cpu_count()
+    reconcile_every = reconcile_every or settings.get("reconcile_every", 7)
+    root = np.random.SeedSequence(seed)
+    macro_seq, base_seq, shards_seq = root.spawn(3)
+
+    if macro_df is None:
+        macro_df = generate_macro_context(days=days, trend_bias=1.0, hype_bias=1.0, rng=np.random.default_rng(macro_seq))
+        write_table("macro_indicators", macro_df)
+    econ = macro_df['Economic_Index'].to_numpy(dtype=float)
+    hype = macro_df['Luxury_Hype'].to_numpy(dtype=float)
+
+    base = DataLoader(seed=base_seq)
+    membership = build_shards(base.clients)
+    total = sum(len(rows) for rows in membership.values())
+    weights = {name: len(rows) / total for name, rows in membership.items()}
+    # Clientes presentes en más de una tienda: su monedero se concilia en cada paso
+    replicas = np.bincount(np.concatenate(list(membership.values())), minlength=len(base.clients))
+    shared = {name: np.flatnonzero(replicas[rows] > 1) for name, rows in membership.items()}
+
+    start_date = datetime.today() - timedelta(days=days)
+    shards = {}
+    for (name, rows), shard_seq in zip(membership.items(), shards_seq.spawn(len(membership))):
+        shards[name] = base.shard(rows, weight=weights[name], seed=shard_seq)
+        shards[name]._restock_inventory(start_date, volume=max(1, round(OPENING_STOCK * weights[name])))
+
+    groups = assign_workers(weights, min(workers, len(shards)))
+    print(f"🏬 Simulación multi-tienda: {len(shards)} tiendas en {len(groups)} procesos "
+          f"({days} días, conciliación cada {reconcile_every} días, semilla {root.entropy})...")
+
+    ctx = mp.get_context()
+    pipes, procs = [], []
+    for group in groups:
+        parent, child = ctx.Pipe()
+        proc = ctx.Process(target=_shard_worker, args=(child, {n: shards[n] for n in group}, econ, hype, start_date), daemon=True)
+        proc.start()
+        child.close()
+        pipes.append(parent)
+        procs.append(proc)
+    del shards
+
+    sink = sink or SimulationSink()
+    sink.reset()
+    wallet = base.clients['Current_Budget'].to_numpy(dtype=float).copy()
+    stats = {name: {'Tienda': name, 'Clientes': len(rows), 'Dias': 0, 'Visitas': 0, 'Ventas': 0, 'Segundos': 0.0}
+             for name, rows in membership.items()}
+    orders = {}
+    t0 = time.perf_counter()
+
+    try:
+        for first_day in range(0, days, reconcile_every):
+            last_day = min(days, first_day + reconcile_every)
+            for pipe in pipes: pipe.send(('run', first_day, last_day, orders))
+            results = {}
+            for pipe in pipes: results.update(pipe.recv())
+
+            # 1. Volcado: ventas por día de todas las tiendas y métricas agregadas
+            for d in range(last_day - first_day):
+                day_sales = [sale for name in membership for sale in results[name]['sales'][d]]
+                day_metrics = {'Fecha': results[next(iter(membership))]['metrics'][d]['Fecha']}
+                for col in SHARD_METRICS:
+                    day_metrics[col] = sum(results[name]['metrics'][d][col] for name in membership)
+                # Agotados: solo en la tienda de origen (las réplicas Online no cuentan dos veces)
+                day_metrics['Depleted_Clients'] = sum(results[name]['metrics'][d]['Depleted_Clients']
+                                                      for name in membership if name != ONLINE_SHARD)
+                sink.add(day_sales, day_metrics)
+            if sink.full: sink.flush()
+
+            # 2. Conciliación de monederos: el gasto de cada tienda se descuenta del monedero común
+            spent = np.zeros_like(wallet)
+            for name, rows in membership.items():
+                np.add.at(spent, rows, wallet[rows] - results[name]['budgets'])
+            wallet = np.maximum(wallet - spent, 0)
+
+            # 3. Traspasos: lo enviado en este bloque llega al destino al empezar el siguiente
+            orders = {name: {'budgets': (shared[name], wallet[rows[shared[name]]])}
+                      for name, rows in membership.items() if len(shared[name])}
+            in_transit = {}
+            for name in membership:
+                for dst, payload in results[name]['shipments']:
+                    orders.setdefault(dst, {}).setdefault('receive', []).append(payload)
+                    in_transit[dst] = in_transit.get(dst, 0) + len(payload[1])
+            available = {name: results[name]['available'] for name in membership}
+            for src, dst, units in plan_transfers(available, weights, in_transit=in_transit):
+                orders.setdefault(src, {}).setdefault('ship', []).append((dst, units))
+
+            for name in membership:
+                res = results[name]
+                stats[name]['Dias'] += last_day - first_day
+                stats[name]['Visitas'] += sum(m['Traffic'] for m in res['metrics'])
+                stats[name]['Ventas'] += sum(len(s) for s in res['sales'])
+                stats[name]['Segundos'] += res['seconds']
+
+        sink.flush()
+        for pipe in pipes: pipe.send(('state', days, orders))
+        final = {}
+        for pipe in pipes: final.update(pipe.recv())
+    finally:
+        for pipe in pipes: pipe.send(None)
+        for proc in procs:
+            proc.join(timeout=30)
+            if proc.is_alive(): proc.terminate()
+    wall = time.perf_counter() - t0
+
+    # Estado final: inventario de todas las tiendas y monederos conciliados
+    frames = []
+    for name, (frame, _) in final.items():
+        if not frame.empty: frames.append(frame.assign(Tienda=name))
+    write_table("inventory", pd.concat(frames, ignore_index=True) if frames else pd.DataFrame())
+    clients = base.clients.copy()
+    clients['Current_Budget'] = wallet
+    write_table("clients_state", clients)
+    # El checkpoint de un run de una sola tienda ya no describe este histórico
+    (FILES["checkpoint"] / "state.json").unlink(missing_ok=True)
+
+    df_stats = pd.DataFrame(list(stats.values()))
+    df_stats['Visitas_s'] = df_stats['Visitas'] / df_stats['Segundos'].clip(lower=1e-9)
+    busy = df_stats['Segundos'].sum()
+    print(f"   ⏱️ {wall:.1f}s reales, {busy:.1f}s de cómputo en tiendas (paralelismo efectivo ×{busy / max(wall, 1e-9):.1f})")
+    return df_stats
@@ -0,0 +1,282 @@
+import time
+import shutil
+import hashlib
+from pathlib import Path
+
+import pandas as pd
+
+from .config import settings, FILES
+
+# Parquet es opcional: sin pyarrow todo sigue funcionando sobre CSV
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+# Tablas temporales que se particionan por mes (columna Mes=YYYY-MM)
+PARTITIONED = {"sales_history", "daily_metrics", "macro_indicators", "weekly_features"}
+PARTITION_COL = "Mes"
+
+# Tipos conocidos por tabla (se aplican al escribir y al leer CSV)
+SCHEMAS = {
+    "sales_history": {"Fecha": "datetime64[ns]", "Marca": "category", "Net_Revenue": "float64",
+                      "Status": "category", "Cluster": "category", "Client_ID": "string",
+                      "Tienda": "category"},
+    "daily_metrics": {"Fecha": "datetime64[ns]", "Revenue": "float64", "Traffic": "int64",
+                      "Stockouts": "int64", "Depleted_Clients": "int64"},
+    "macro_indicators": {"Fecha": "datetime64[ns]", "Economic_Index": "float64", "Luxury_Hype": "float64"},
+    "forecast": {"Fecha": "datetime64[ns]", "Cluster": "category", "Prediccion_Realista": "float64",
+                 "Escenario_Pesimista": "float64", "Escenario_Optimista": "float64", "Riesgo_Score": "float64"},
+    "weekly_features": {"Fecha": "datetime64[ns]", "Serie": "string", "Net_Revenue": "float64",
+                        "Week_Sin": "float64", "Week_Cos": "float64", "Lag_1": "float64",
+                        "Lag_4": "float64", "Rolling_Mean_4": "float64"},
+    "recommendation_state": {"Client_ID": "string", "Fingerprint": "int64", "Profile": "int64"},
+}
+
+
+def parquet_path(key):
+    """Ruta columnar de una tabla: directorio para las particionadas, .parquet para el resto."""
+    csv_path = Path(FILES[key])
+    return csv_path.with_suffix("") if key in PARTITIONED else csv_path.with_suffix(".parquet")
+
+
+def table_exists(key):
+    return (HAS_PARQUET and parquet_path(key).exists()) or Path(FILES[key]).exists()
+
+
+def table_fingerprint(key):
+    """
+    Huella barata de una tabla: ficheros que la respaldan (Parquet y CSV) con su
+    tamaño y mtime. Cualquier escritura, append o edición externa la cambia.
+    """
+    path = parquet_path(key)
+    files = []
+    if HAS_PARQUET and path.exists():
+        files += sorted(path.rglob("*.parquet")) if path.is_dir() else [path]
+    if Path(FILES[key]).exists(): files.append(Path(FILES[key]))
+
+    digest = hashlib.sha256(key.encode())
+    for f in files:
+        stat = f.stat()
+        digest.update(f"{f}|{stat.st_size}|{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()[:16]
+
+
+def _newest_mtime(path):
+    if path.is_dir():
+        # Incluye el propio directorio: borrar una partición entera también cuenta como escritura
+        return max([path.stat().st_mtime] + [p.stat().st_mtime for p in path.rglob("*.parquet")])
+    return path.stat().st_mtime if path.exists() else 0
+
+
+def _parquet_is_current(key):
+    """Parquet vale salvo que alguien haya reescrito el CSV después (scripts externos)."""
+    path = parquet_path(key)
+    if not (HAS_PARQUET and path.exists()): return False
+    csv_path = Path(FILES[key])
+    return not csv_path.exists() or _newest_mtime(path) >= csv_path.stat().st_mtime
+
+
+def _apply_schema(key, df):
+    for col, dtype in SCHEMAS.get(key, {}).items():
+        if col not in df.columns: continue
+        if dtype.startswith("datetime"):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+        elif dtype == "int64":
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype("int64")
+        else:
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def _read_csv(key, columns=None):
+    path = Path(FILES[key])
+    if not path.exists(): return pd.DataFrame()
+    schema = SCHEMAS.get(key, {})
+    usecols = (lambda c: c in columns) if columns else None
+    dates = [c for c, t in schema.items() if t.startswith("datetime") and (not columns or c in columns)]
+    dtypes = {c: t for c, t in schema.items() if not t.startswith("datetime") and t != "int64"}
+    try:
+        df = pd.read_csv(path, usecols=usecols, dtype=dtypes, parse_dates=dates)
+    except (ValueError, pd.errors.ParserError):
+        # Fallback: separador desconocido (ficheros antiguos con ';')
+        df = pd.read_csv(path, sep=None, engine="python")
+        if columns: df = df[[c for c in columns if c in df.columns]]
+    return _apply_schema(key, df)
+
+
+def read_table(key, columns=None, filters=None):
+    """
+    Lectura rápida y tipada. Usa Parquet si existe (con proyección de columnas y
+    filtros de partición, p.ej. [('Mes', '>=', '2025-01')]) y si no, el CSV.
+    """
+    if not _parquet_is_current(key):
+        return _read_csv(key, columns)
+
+    if columns:
+        # Igual que usecols en el CSV: las columnas pedidas que la tabla no tenga se ignoran
+        available = set(pq.ParquetDataset(str(parquet_path(key))).schema.names)
+        columns = [c for c in columns if c in available]
+    df = pd.read_parquet(parquet_path(key), columns=columns, filters=filters)
+    if key in PARTITIONED:
+        if PARTITION_COL in df.columns and (not columns or PARTITION_COL not in columns):
+            df = df.drop(columns=PARTITION_COL)
+        if "Fecha" in df.columns:
+            df = df.sort_values("Fecha", kind="stable").reset_index(drop=True)
+    return df
+
+
+def iter_table(key, batch_rows=100_000):
+    """Lee una tabla no particionada por bloques de batch_rows filas, en el orden en que se escribió."""
+    if key in PARTITIONED: raise ValueError(f"iter_table no admite tablas particionadas ({key}): usa read_table con filters")
+    if _parquet_is_current(key):
+        for batch in pq.ParquetFile(parquet_path(key)).iter_batches(batch_size=batch_rows):
+            yield _apply_schema(key, batch.to_pandas())
+    elif Path(FILES[key]).exists():
+        for df in pd.read_csv(FILES[key], chunksize=batch_rows):
+            yield _apply_schema(key, df)
+
+
+def _write_parquet(key, df, append=False):
+    path = parquet_path(key)
+    table_df = df.copy()
+    if key in PARTITIONED:
+        if not append and path.exists(): shutil.rmtree(path)
+        table_df[PARTITION_COL] = pd.to_datetime(table_df["Fecha"]).dt.strftime("%Y-%m")
+        # Nombre con marca temporal: los ficheros de cada partición quedan en orden de escritura
+        pq.write_to_dataset(pa.Table.from_pandas(table_df, preserve_index=False), root_path=str(path),
+                            partition_cols=[PARTITION_COL], basename_template=f"part-{time.time_ns()}-{{i}}.parquet",
+                            compression="zstd")
+    else:
+        if append and path.exists():
+            table_df = pd.concat([pd.read_parquet(path), table_df], ignore_index=True)
+        table_df.to_parquet(path, index=False, compression="zstd")
+
+
+def append_csv(df, path):
+    """Añade filas a un CSV respetando la cabecera existente (columnas que falten quedan vacías)."""
+    path = Path(path)
+    if path.exists() and path.stat().st_size > 0:
+        df = df.reindex(columns=pd.read_csv(path, nrows=0).columns)
+        df.to_csv(path, mode="a", header=False, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def write_table(key, df, export_csv=None):
+    """Reescribe una tabla completa (Parquet tipado + CSV opcional)."""
+    export_csv = settings.get("export_csv", True) if export_csv is None else export_csv
+    df = _apply_schema(key, df.copy())
+    # CSV primero: el Parquet queda siempre igual o más reciente que su exportación
+    if export_csv or not HAS_PARQUET: df.to_csv(FILES[key], index=False)
+    if HAS_PARQUET: _write_parquet(key, df)
+
+
+def append_table(key, df, export_csv=None):
+    """Añade filas nuevas sin reescribir el histórico (en Parquet: ficheros nuevos por partición)."""
+    if df is None or df.empty: return
+    export_csv = settings.get("export_csv", True) if export_csv is None else export_csv
+    if HAS_PARQUET and not _parquet_is_current(key) and Path(FILES[key]).exists():
+        # Primera vez en columnar (o CSV modificado por fuera): se migra el CSV antes de añadir
+        _write_parquet(key, _read_csv(key))
+    if HAS_PARQUET and parquet_path(key).exists():
+        # Mismo esquema que los ficheros ya escritos (como hace append_csv con la cabecera)
+        existing = [c for c in pq.ParquetDataset(str(parquet_path(key))).schema.names if c != PARTITION_COL]
+        df = df.reindex(columns=existing)
+    df = _apply_schema(key, df.copy())
+    if export_csv or not HAS_PARQUET: append_csv(df, FILES[key])
+    if HAS_PARQUET: _write_parquet(key, df, append=True)
+
+
+def replace_partitions(key, df, months, export_csv=None):
+    """
+    Reescribe solo los meses (particiones YYYY-MM) de months con las filas de df, que
+    debe traer todas las de esos meses; el resto de la tabla no se toca. Los ficheros
+    nuevos se escriben antes de borrar los sustituidos. Meses sin filas quedan vacíos.
+    """
+    if key not in PARTITIONED: raise ValueError(f"replace_partitions solo admite tablas particionadas ({key}): usa write_table")
+    months = set(months)
+    if not months: return
+    export_csv = settings.get("export_csv", True) if export_csv is None else export_csv
+    df = _apply_schema(key, df.copy())
+    if export_csv or not HAS_PARQUET:
+        # El CSV es una exportación plana: se recompone entero
+        old = _read_csv(key)
+        if not old.empty: old = old[~old["Fecha"].dt.strftime("%Y-%m").isin(months)]
+        pd.concat([old, df], ignore_index=True).to_csv(FILES[key], index=False)
+    if HAS_PARQUET:
+        path = parquet_path(key)
+        folders = [path / f"{PARTITION_COL}={m}" for m in months]
+        stale = [f for folder in folders for f in folder.glob("*.parquet")]
+        if not df.empty: _write_parquet(key, df, append=True)
+        for f in stale: f.unlink()
+        for folder in folders:
+            if folder.is_dir() and not any(folder.iterdir()): folder.rmdir()
+
+
+def drop_table(key):
+    """Borra una tabla (CSV y Parquet) para empezar a escribirla de cero."""
+    Path(FILES[key]).unlink(missing_ok=True)
+    path = parquet_path(key)
+    if path.is_dir(): shutil.rmtree(path)
+    else: path.unlink(missing_ok=True)
+
+
+def truncate_table(key, n_rows):
+    """Recorta una tabla a sus primeras n_rows filas (p.ej. bloques escritos tras el último checkpoint)."""
+    if not table_exists(key): return
+    df = read_table(key)
+    if len(df) > n_rows: write_table(key, df.head(n_rows))
+
+
+class TableWriter:
+    """
+    Escritura en streaming de una tabla completa, bloque a bloque, con memoria constante:
+    un único Parquet (un row group por bloque) + CSV opcional. Se escribe en ficheros
+    temporales que sustituyen a la tabla al cerrar: los lectores nunca ven una a medias.
+
+        with TableWriter("recommendations") as out:
+            for df in bloques: out.write(df)
+    """
+
+    def __init__(self, key, export_csv=None):
+        if key in PARTITIONED: raise ValueError(f"TableWriter no admite tablas particionadas ({key}): usa append_table")
+        self.key = key
+        self.export_csv = settings.get("export_csv", True) if export_csv is None else export_csv
+        self.csv_tmp = Path(FILES[key]).with_suffix(".csv.tmp")
+        self.parquet_tmp = parquet_path(key).with_suffix(".parquet.tmp")
+        self._parquet = None
+        self.rows = 0
+
+    def write(self, df):
+        if df is None or df.empty: return
+        df = _apply_schema(self.key, df.copy())
+        if self.export_csv or not HAS_PARQUET:
+            df.to_csv(self.csv_tmp, mode="a" if self.rows else "w", header=not self.rows, index=False)
+        if HAS_PARQUET:
+            # Todos los bloques con el esquema del primero
+            schema = self._parquet.schema if self._parquet is not None else None
+            table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+            if self._parquet is None:
+                self._parquet = pq.ParquetWriter(self.parquet_tmp, table.schema, compression="zstd")
+            self._parquet.write_table(table)
+        self.rows += len(df)
+
+    def close(self, commit=True):
+        """Publica la tabla (commit) o descarta lo escrito. Sin filas no se toca la tabla anterior."""
+        if self._parquet is not None: self._parquet.close()
+        self._parquet = None
+        if commit and self.rows:
+            # CSV primero: el Parquet queda siempre igual o más reciente que su exportación
+            if self.csv_tmp.exists(): self.csv_tmp.replace(FILES[self.key])
+            if self.parquet_tmp.exists(): self.parquet_tmp.replace(parquet_path(self.key))
+        self.csv_tmp.unlink(missing_ok=True)
+        self.parquet_tmp.unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(commit=exc_type is None)
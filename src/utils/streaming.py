@@ -0,0 +1,53 @@
+import pandas as pd
+
+from .config import settings
+from .storage import append_table, drop_table, truncate_table
+
+
+class SimulationSink:
+    """
+    Volcado por bloques de ventas y métricas diarias de una simulación larga.
+    Como mucho se retienen chunk_rows filas en memoria: al llenarse el bloque se
+    añade a sales_history / daily_metrics con append_table (ficheros Parquet
+    nuevos por partición + CSV en modo append), sin reescribir lo anterior.
+    """
+
+    def __init__(self, chunk_rows=None, export_csv=None):
+        self.chunk_rows = chunk_rows or settings.get("stream_chunk_rows", 50_000)
+        self.export_csv = export_csv
+        self.sales, self.metrics = [], []
+        # Filas ya escritas a disco (las usa el checkpoint para poder reanudar)
+        self.sales_rows = 0
+        self.metrics_rows = 0
+
+    def reset(self):
+        """Run nuevo: el histórico anterior se descarta."""
+        drop_table("sales_history")
+        drop_table("daily_metrics")
+        self.sales, self.metrics = [], []
+        self.sales_rows = self.metrics_rows = 0
+
+    def resume(self, sales_rows, metrics_rows):
+        """Run reanudado: se eliminan los bloques escritos después del último checkpoint."""
+        truncate_table("sales_history", sales_rows)
+        truncate_table("daily_metrics", metrics_rows)
+        self.sales, self.metrics = [], []
+        self.sales_rows, self.metrics_rows = sales_rows, metrics_rows
+
+    def add(self, day_sales, day_metrics):
+        self.sales.extend(day_sales)
+        self.metrics.append(day_metrics)
+
+    @property
+    def full(self):
+        return len(self.sales) >= self.chunk_rows or len(self.metrics) >= self.chunk_rows
+
+    def flush(self):
+        """Escribe el bloque pendiente y lo devuelve como (ventas, métricas)."""
+        df_sales, df_metrics = pd.DataFrame(self.sales), pd.DataFrame(self.metrics)
+        append_table("sales_history", df_sales, export_csv=self.export_csv)
+        append_table("daily_metrics", df_metrics, export_csv=self.export_csv)
+        self.sales_rows += len(df_sales)
+        self.metrics_rows += len(df_metrics)
+        self.sales, self.metrics = [], []
+        return df_sales, df_metrics